@@ -2,8 +2,24 @@ import React, { useState, useEffect } from 'react';
 import { LineChart, Line, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import './Analytics.css';
 
+const USERS_PAGE_SIZE = 50;
+
+// Sortable columns of the users table (server-side sort keys)
+const USER_COLUMNS = [
+  { label: 'Email', sort: 'email' },
+  { label: 'Name' },
+  { label: 'Conversations', sort: 'conversations' },
+  { label: 'Total Tokens', sort: 'tokens' },
+  { label: 'Total Cost', sort: 'cost' },
+  { label: 'Joined', sort: 'created_at' }
+];
+
 const Analytics = ({ token }) => {
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [sort, setSort] = useState({ key: 'created_at', order: 'desc' });
+  const [search, setSearch] = useState('');
+  const [loadingUsers, setLoadingUsers] = useState(false);
   const [stats, setStats] = useState(null);
   const [usageData, setUsageData] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -12,15 +28,52 @@ const Analytics = ({ token }) => {
     fetchAnalyticsData();
   }, [token]);
 
+  // Reload the first page when the sort or search changes (search is debounced)
+  useEffect(() => {
+    const timer = setTimeout(() => fetchUsers(), 300);
+    return () => clearTimeout(timer);
+  }, [token, sort, search]);
+
+  const fetchUsers = async (cursor = null) => {
+    try {
+      setLoadingUsers(true);
+      const params = new URLSearchParams({
+        limit: USERS_PAGE_SIZE,
+        sort: sort.key,
+        order: sort.order
+      });
+      if (cursor) params.set('cursor', cursor);
+      if (search.trim()) params.set('search', search.trim());
+
+      const res = await fetch(`/api/admin/users?${params}`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      if (res.ok) {
+        const data = await res.json();
+        // A cursor continues the current listing; no cursor starts a new one
+        setUsers(prev => cursor ? [...prev, ...(data.users || [])] : (data.users || []));
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      console.error('Error fetching users:', error);
+    } finally {
+      setLoadingUsers(false);
+    }
+  };
+
+  const toggleSort = (key) => {
+    setSort(prev => ({
+      key,
+      order: prev.key === key && prev.order === 'desc' ? 'asc' : 'desc'
+    }));
+  };
+
   const fetchAnalyticsData = async () => {
     try {
       setLoading(true);
       
-      // Fetch all data in parallel
-      const [usersRes, statsRes, usageRes] = await Promise.all([
-        fetch('/api/admin/users', {
-          headers: { 'Authorization': `Bearer ${token}` }
-        }),
+      // Fetch stats and usage in parallel; users are paged separately
+      const [statsRes, usageRes] = await Promise.all([
         fetch('/api/admin/stats', {
           headers: { 'Authorization': `Bearer ${token}` }
         }),
@@ -29,11 +82,6 @@ const Analytics = ({ token }) => {
         })
       ]);
 
-      if (usersRes.ok) {
-        const usersData = await usersRes.json();
-        setUsers(usersData.users || []);
-      }
-
       if (statsRes.ok) {
         const statsData = await statsRes.json();
         setStats(statsData);
@@ -58,7 +106,7 @@ const Analytics = ({ token }) => {
     <div className="analytics">
       <div className="analytics-header">
         <h2>📊 Analytics Dashboard</h2>
-        <button onClick={fetchAnalyticsData} className="refresh-btn">
+        <button onClick={() => { fetchAnalyticsData(); fetchUsers(); }} className="refresh-btn">
           🔄 Refresh
         </button>
       </div>
@@ -96,6 +144,14 @@ const Analytics = ({ token }) => {
             <div className="stat-label">Total Cost</div>
           </div>
         </div>
+
+        <div className="stat-card">
+          <div className="stat-icon">⚡</div>
+          <div className="stat-content">
+            <div className="stat-value">{stats?.cache_hits?.toLocaleString() || 0}</div>
+            <div className="stat-label">Cached Answers (~${(stats?.estimated_cache_savings || 0).toFixed(4)} saved)</div>
+          </div>
+        </div>
       </div>
 
       {/* Charts */}
@@ -131,17 +187,30 @@ const Analytics = ({ token }) => {
 
       {/* Users Table */}
       <div className="users-table-container">
-        <h3>👥 All Users</h3>
+        <div className="users-table-header">
+          <h3>👥 All Users</h3>
+          <input
+            type="search"
+            className="users-search"
+            placeholder="Search by email prefix..."
+            value={search}
+            onChange={(e) => setSearch(e.target.value)}
+          />
+        </div>
         <div className="table-wrapper">
           <table className="users-table">
             <thead>
               <tr>
-                <th>Email</th>
-                <th>Name</th>
-                <th>Conversations</th>
-                <th>Total Tokens</th>
-                <th>Total Cost</th>
-                <th>Joined</th>
+                {USER_COLUMNS.map((column) => (
+                  <th
+                    key={column.label}
+                    className={column.sort ? 'sortable' : undefined}
+                    onClick={column.sort ? () => toggleSort(column.sort) : undefined}
+                  >
+                    {column.label}
+                    {sort.key === column.sort && (sort.order === 'desc' ? ' ▼' : ' ▲')}
+                  </th>
+                ))}
               </tr>
             </thead>
             <tbody>
@@ -155,16 +224,25 @@ const Analytics = ({ token }) => {
                   <td>{new Date(user.created_at).toLocaleDateString()}</td>
                 </tr>
               ))}
-              {users.length === 0 && (
+              {users.length === 0 && !loadingUsers && (
                 <tr>
                   <td colSpan="6" style={{textAlign: 'center', padding: '20px'}}>
-                    No users yet
+                    {search.trim() ? 'No matching users' : 'No users yet'}
                   </td>
                 </tr>
               )}
             </tbody>
           </table>
         </div>
+        {nextCursor && (
+          <button
+            onClick={() => fetchUsers(nextCursor)}
+            className="load-more-btn"
+            disabled={loadingUsers}
+          >
+            {loadingUsers ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
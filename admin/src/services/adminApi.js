@@ -17,7 +17,9 @@ export const login = async (username, password) => {
 };
 
 export const getSettings = async (token) => {
+  // Revalidate instead of reusing the browser's copy, so edits show up right away
   const response = await fetch(`${API_BASE_URL}/admin/settings`, {
+    cache: 'no-cache',
     headers: {
       'Authorization': `Bearer ${token}`
     }
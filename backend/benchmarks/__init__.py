@@ -0,0 +1 @@
+# Backend __init__ files for proper Python package structure
@@ -0,0 +1,156 @@
+"""
+Chat pipeline concurrency benchmark
+
+Runs many concurrent chat turns against a stubbed Gemini (fixed-latency
+embedding and generation calls) and compares:
+- blocking: every step called inline from the coroutine, as /api/chat used to
+- offloaded: the current routes.chat.chat handler using the bounded pools
+
+Nothing touches the network or the real database. Run from backend/:
+    python -m benchmarks.bench_chat_concurrency --turns 100 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import chromadb
+import google.generativeai as genai
+
+from database import db
+from models.conversation import ChatRequest
+
+EMBEDDING_DIM = 768
+
+class StubUsage:
+    prompt_token_count = 500
+    candidates_token_count = 120
+    total_token_count = 620
+
+class StubResponse:
+    text = "Stubbed answer from the benchmark model."
+    usage_metadata = StubUsage()
+
+def install_stubs(llm_latency: float, embed_latency: float):
+    """Replace the Gemini SDK entry points with fixed-latency stubs"""
+    class StubModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, prompt, **kwargs):
+            time.sleep(llm_latency)
+            return StubResponse()
+
+    def stub_embed_content(model=None, content=None, task_type=None, **kwargs):
+        time.sleep(embed_latency)
+        rng = random.Random(hash(content))
+        return {"embedding": [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]}
+
+    genai.GenerativeModel = StubModel
+    genai.embed_content = stub_embed_content
+
+def setup_knowledge_base(num_chunks: int = 50):
+    """Point the RAG service at an in-memory collection and BM25 index of random chunks"""
+    from services import rag_service
+    from services.lexical_index import BM25Index
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name=f"bench_{uuid.uuid4().hex}")
+    rng = random.Random(42)
+    ids = [f"chunk_{i}" for i in range(num_chunks)]
+    documents = [f"Benchmark chunk {i} about IPTV setup." for i in range(num_chunks)]
+    collection.add(
+        embeddings=[[rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)] for _ in range(num_chunks)],
+        documents=documents,
+        ids=ids
+    )
+    # Everything sync_knowledge_base would set, so search never triggers a real sync
+    rag_service.collection = collection
+    rag_service.collection_size = num_chunks
+    rag_service.lexical_index = BM25Index(ids, documents)
+    rag_service.knowledge_version = f"bench-{num_chunks}"
+
+async def blocking_chat(request: ChatRequest, user_id: int):
+    """The chat turn with every blocking call made directly on the event loop"""
+    from routes.chat import finalize_turn
+    from services.rag_service import search_knowledge
+    from services.llm_service import generate_response_with_tokens
+
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    db.save_conversation_with_user(conversation_id, user_id)
+    db.save_message(conversation_id, "user", request.message)
+    conversation_memory = db.get_conversation_history(conversation_id)
+    relevant_chunks, _ = search_knowledge(request.message, top_k=5)
+    tone_instructions = db.get_setting("tone_instructions")
+    ai_response, token_info = generate_response_with_tokens(
+        system_instructions=tone_instructions,
+        context="\n\n".join(relevant_chunks),
+        user_message=request.message
+    )
+    finalize_turn(conversation_id, user_id, request.message, conversation_memory, ai_response, token_info)
+
+async def run_turns(handler, turns: int, user_id: int) -> dict:
+    """Run all turns concurrently and collect latency statistics"""
+    latencies = []
+
+    async def one_turn(i):
+        start = time.perf_counter()
+        await handler(ChatRequest(message=f"How do I set up IPTV on device {i}?"), user_id=user_id)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_turn(i) for i in range(turns)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "wall_s": wall,
+        "throughput": turns / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+def print_result(name: str, result: dict):
+    print(
+        f"{name:<10} wall {result['wall_s']:7.2f}s  "
+        f"throughput {result['throughput']:7.1f} turns/s  "
+        f"p50 {result['p50_ms']:8.1f}ms  p95 {result['p95_ms']:8.1f}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50, help="concurrent chat turns to run")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stubbed generation latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="stubbed embedding latency (s)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="chat_bench_")
+    db.DB_PATH = Path(tmp_dir) / "bench.db"
+    db.init_database()
+    user_id = db.create_user(f"bench-{uuid.uuid4().hex}@example.com", "Bench", "bench")
+
+    install_stubs(args.llm_latency, args.embed_latency)
+    setup_knowledge_base()
+
+    from routes.chat import chat
+    from services.executor import shutdown_pools
+
+    print(f"{args.turns} concurrent turns, LLM latency {args.llm_latency}s, embedding latency {args.embed_latency}s")
+    blocking = asyncio.run(run_turns(blocking_chat, args.turns, user_id))
+    print_result("blocking", blocking)
+    offloaded = asyncio.run(run_turns(chat, args.turns, user_id))
+    print_result("offloaded", offloaded)
+    print(f"speedup    {blocking['wall_s'] / offloaded['wall_s']:.1f}x")
+
+    shutdown_pools()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Chunker benchmark: legacy character chunker vs the sentence-aware chunker
+
+Builds a multi-megabyte corpus by repeating data/article.txt, writes it to a
+temporary file and chunks it both ways, the way ingestion would:
+- legacy: read the whole file, then chunk_text() as it was before
+  chunker.py (400 characters, 75 overlap, rfind on each slice)
+- chunker: stream the file in blocks through chunker.iter_chunks()
+  (100 tokens, up to 20 tokens of sentence overlap)
+
+Reports chunking time and throughput, peak Python memory, chunk count,
+characters embedded per character of input (overlap overhead), chunks
+fully contained in their predecessor (pure duplicates), and the time to
+chunk and then embed everything with the local embedder, which is what an
+ingestion run pays since embedding costs far more than chunking.
+
+Run from backend/:
+    python -m benchmarks.bench_chunker --megabytes 8
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.chunker import iter_chunks
+from services.embedding_service import LocalHashEmbedder
+from services.documents import ARTICLE_PATH, iter_document_text
+
+def legacy_chunk_text(text: str, chunk_size: int = 400, overlap: int = 75) -> list:
+    """The character chunker that rag_service used before chunker.py"""
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        end = start + chunk_size
+        chunk = text[start:end]
+
+        if end < text_length:
+            last_period = chunk.rfind('.')
+            last_newline = chunk.rfind('\n')
+            break_point = max(last_period, last_newline)
+
+            if break_point > chunk_size * 0.5:
+                chunk = text[start:start + break_point + 1]
+                end = start + break_point + 1
+
+        chunks.append(chunk.strip())
+        start = end - overlap
+
+    return chunks
+
+def run_legacy(path: Path) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return legacy_chunk_text(f.read())
+
+def run_chunker(path: Path) -> list:
+    return [chunk["text"] for chunk in iter_chunks(iter_document_text(path))]
+
+def timed(func, path: Path):
+    start = time.perf_counter()
+    result = func(path)
+    return result, time.perf_counter() - start
+
+def measure(func, path: Path, input_chars: int, repeats: int, embedder) -> dict:
+    seconds = min(timed(func, path)[1] for _ in range(repeats))
+
+    # Memory is measured on a separate run; tracing slows allocation-heavy code unevenly
+    tracemalloc.start()
+    chunks = func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # What ingestion pays per chunk: one embedding each (local embedder, so no network)
+    start = time.perf_counter()
+    embedder.embed(chunks)
+    embed_seconds = time.perf_counter() - start
+
+    return {
+        "seconds": seconds,
+        "mb_per_s": input_chars / 1e6 / seconds,
+        "peak_mb": peak / 1e6,
+        "embed_seconds": embed_seconds,
+        "chunks": len(chunks),
+        "embedded_ratio": sum(len(chunk) for chunk in chunks) / input_chars,
+        "duplicates": sum(1 for previous, chunk in zip(chunks, chunks[1:]) if chunk in previous),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=8, help="corpus size")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per chunker (best is reported)")
+    args = parser.parse_args()
+
+    article = ARTICLE_PATH.read_text(encoding="utf-8")
+    copies = max(1, int(args.megabytes * 1e6 / len(article)))
+    path = Path(tempfile.mkdtemp(prefix="chunker_bench_")) / "corpus.txt"
+    path.write_text("\n\n".join([article] * copies), encoding="utf-8")
+    input_chars = len(path.read_text(encoding="utf-8"))
+
+    print(f"corpus: {input_chars / 1e6:.1f}M characters")
+    print(f"{'chunker':<10}{'seconds':>9}{'MB/s':>8}{'peak MB':>9}{'chunks':>9}{'embedded':>10}{'duplicates':>12}{'+embed s':>10}")
+    embedder = LocalHashEmbedder()
+    for name, func in (("legacy", run_legacy), ("chunker", run_chunker)):
+        report = measure(func, path, input_chars, args.repeats, embedder)
+        print(f"{name:<10}{report['seconds']:>9.3f}{report['mb_per_s']:>8.1f}{report['peak_mb']:>9.1f}"
+              f"{report['chunks']:>9}{report['embedded_ratio']:>9.2f}x{report['duplicates']:>12}"
+              f"{report['seconds'] + report['embed_seconds']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
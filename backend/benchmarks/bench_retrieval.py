@@ -0,0 +1,161 @@
+"""
+Offline retrieval benchmark and regression check
+
+Chunks the knowledge base (chunker.py), builds the index with initialize_rag() and runs
+search_knowledge() over the checked-in question set
+(benchmarks/retrieval_questions.json). No network access is needed:
+embeddings come from the local hashed n-gram embedder
+(EMBEDDING_PROVIDER=local), and the index is built in a temporary
+directory.
+
+Reports chunking time, index build time and memory, search p50/p95 latency
+and throughput, and recall@k / MRR. Use --json to write the results and
+--baseline to compare against a previous run; the exit code is 1 when
+quality drops or latency grows beyond the tolerances, so CI can flag it.
+
+Run from backend/:
+    python -m benchmarks.bench_retrieval --json results.json
+    python -m benchmarks.bench_retrieval --chunk-tokens 150 --overlap-tokens 30 --baseline results.json
+"""
+
+import argparse
+import json
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services import embedding_service, rag_service
+from services.embedding_service import LocalHashEmbedder
+
+QUESTIONS_PATH = Path(__file__).parent / "retrieval_questions.json"
+
+def use_local_embeddings():
+    """Build and search with the local hashed n-gram embedder"""
+    embedding_service.embedder = LocalHashEmbedder()
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * fraction) - 1)]
+
+def bench_chunking(repeats: int) -> dict:
+    paths = rag_service.list_documents()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = sum(1 for _ in rag_service.iter_chunk_records())
+        timings.append(time.perf_counter() - start)
+    characters = sum(path.stat().st_size for path in paths)
+    return {"documents": len(paths), "chunks": chunks, "chunk_ms": statistics.median(timings) * 1000,
+            "chunk_mb_per_s": characters / 1e6 / statistics.median(timings)}
+
+def bench_build() -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    rag_service.initialize_rag()
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"build_s": build_seconds, "build_python_peak_mb": peak / 1e6,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def bench_search(questions: list, top_k: int, repeats: int) -> dict:
+    latencies = []
+    reciprocal_ranks = []
+    hits = 0
+    for _ in range(repeats):
+        for item in questions:
+            start = time.perf_counter()
+            documents, _ = rag_service.search_knowledge(item["question"], top_k=top_k)
+            latencies.append(time.perf_counter() - start)
+            rank = next((i for i, document in enumerate(documents, start=1)
+                         if any(passage in document for passage in item["expected"])), None)
+            hits += rank is not None
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {
+        "queries": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "qps": len(latencies) / sum(latencies),
+        f"recall_at_{top_k}": hits / len(latencies),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "paths": rag_service.get_retrieval_stats(),
+    }
+
+def compare(results: dict, baseline: dict, quality_tolerance: float, latency_tolerance: float) -> list:
+    """Regressions of results against a baseline run"""
+    regressions = []
+    for key in results["search"]:
+        if key.startswith("recall_at_") or key == "mrr":
+            if key in baseline["search"] and results["search"][key] < baseline["search"][key] - quality_tolerance:
+                regressions.append(f"{key}: {baseline['search'][key]:.3f} -> {results['search'][key]:.3f}")
+    for section, key in (("search", "p95_ms"), ("build", "build_s")):
+        old, new = baseline[section][key], results[section][key]
+        if new > old * (1 + latency_tolerance):
+            regressions.append(f"{key}: {old:.3f} -> {new:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-tokens", type=int, default=rag_service.CHUNK_TOKENS, help="token budget per chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=rag_service.CHUNK_OVERLAP_TOKENS, help="maximum sentence overlap between chunks")
+    parser.add_argument("--top-k", type=int, default=5, help="chunks retrieved per question (chat uses 5)")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=rag_service.VECTOR_BACKEND, help="vector backend")
+    parser.add_argument("--repeats", type=int, default=20, help="passes over the question set")
+    parser.add_argument("--json", type=Path, help="write results to this file")
+    parser.add_argument("--baseline", type=Path, help="compare against results from a previous run")
+    parser.add_argument("--quality-tolerance", type=float, default=0.02, help="allowed absolute drop in recall/MRR")
+    parser.add_argument("--latency-tolerance", type=float, default=0.5, help="allowed relative growth in p95 and build time")
+    args = parser.parse_args()
+
+    # Build in a scratch directory so the real index is never touched
+    scratch = Path(tempfile.mkdtemp(prefix="retrieval_bench_"))
+    rag_service.STORAGE_DIR = scratch / "embeddings_db"
+    rag_service.MANIFEST_PATH = rag_service.STORAGE_DIR / "ingestion_manifest.json"
+    rag_service.NUMPY_INDEX_DIR = scratch / "vector_index"
+    rag_service.chroma_client = None
+    rag_service.CHUNK_TOKENS = args.chunk_tokens
+    rag_service.CHUNK_OVERLAP_TOKENS = args.overlap_tokens
+    rag_service.VECTOR_BACKEND = args.backend
+    use_local_embeddings()
+
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+
+    results = {
+        "config": {"chunk_tokens": args.chunk_tokens, "overlap_tokens": args.overlap_tokens, "top_k": args.top_k,
+                   "backend": args.backend, "questions": len(questions)},
+        "chunking": bench_chunking(repeats=5),
+        "build": bench_build(),
+    }
+    results["search"] = bench_search(questions, args.top_k, args.repeats)
+
+    chunking, build, search = results["chunking"], results["build"], results["search"]
+    print(f"config:   {results['config']}")
+    print(f"chunking: {chunking['chunks']} chunks from {chunking['documents']} documents in {chunking['chunk_ms']:.2f} ms")
+    print(f"build:    {build['build_s']:.3f} s, python peak {build['build_python_peak_mb']:.1f} MB, max RSS {build['max_rss_mb']:.0f} MB")
+    print(f"search:   p50 {search['p50_ms']:.3f} ms, p95 {search['p95_ms']:.3f} ms, {search['qps']:.0f} queries/s")
+    print(f"quality:  recall@{args.top_k} {search[f'recall_at_{args.top_k}']:.3f}, MRR {search['mrr']:.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.quality_tolerance, args.latency_tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Vector backend benchmark: ChromaDB vs the in-process NumPy store
+
+Builds each backend from the same synthetic, clustered embeddings (so the
+nearest neighbours are meaningful), then runs the same queries against
+all of them. Recall@k is measured against exact float64 cosine search.
+Size is the persisted index on disk; for the NumPy store the in-memory
+matrix size is reported too.
+
+Run from backend/:
+    python -m benchmarks.bench_vector_backends --vectors 5000 --dim 768 --queries 500
+"""
+
+import argparse
+import contextlib
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.vector_store import NumpyVectorStore
+
+# Chroma rejects larger add() batches
+ADD_BATCH_SIZE = 1000
+
+def make_dataset(vectors: int, dim: int, queries: int, seed: int = 7):
+    """Clustered unit vectors plus queries drawn near random corpus rows"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, vectors // 50), dim))
+    corpus = centers[rng.integers(0, len(centers), vectors)] + 0.5 * rng.normal(size=(vectors, dim))
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = rng.integers(0, vectors, queries)
+    probes = corpus[picks] + 0.1 * rng.normal(size=(queries, dim))
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return corpus.astype(np.float32), probes.astype(np.float32)
+
+def exact_top_k(corpus: np.ndarray, probes: np.ndarray, k: int) -> list:
+    scores = probes.astype(np.float64) @ corpus.astype(np.float64).T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def build(name: str, corpus: np.ndarray, dtype: str = None):
+    """Create a backend in a temp dir and add the corpus; returns (collection, path, build seconds)"""
+    path = Path(tempfile.mkdtemp(prefix=f"vector_bench_{name}_"))
+    if name == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=str(path)).get_or_create_collection(name="bench")
+    else:
+        collection = NumpyVectorStore(path, "bench", dtype)
+
+    ids = [str(i) for i in range(len(corpus))]
+    start = time.perf_counter()
+    # Batched adds, like ingestion; the NumPy store saves once when deferred_writes() ends
+    with getattr(collection, "deferred_writes", contextlib.nullcontext)():
+        for i in range(0, len(corpus), ADD_BATCH_SIZE):
+            collection.add(ids=ids[i:i + ADD_BATCH_SIZE], embeddings=corpus[i:i + ADD_BATCH_SIZE].tolist(),
+                           documents=ids[i:i + ADD_BATCH_SIZE])
+    return collection, path, time.perf_counter() - start
+
+def run(name: str, corpus: np.ndarray, probes: np.ndarray, truth: list, k: int, dtype: str = None) -> dict:
+    collection, path, build_seconds = build(name, corpus, dtype)
+    if name != "chroma":
+        # Measure the memory-mapped path used after a restart
+        collection = NumpyVectorStore(path, "bench", dtype)
+
+    latencies = []
+    hits = 0
+    for probe, expected in zip(probes, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[probe.tolist()], n_results=k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(expected & {int(i) for i in result["ids"][0]})
+    latencies.sort()
+
+    report = {
+        "build_s": build_seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "recall": hits / (len(truth) * k),
+        "disk_mb": dir_size(path) / 1e6,
+    }
+    if name != "chroma":
+        vectors = collection._state["vectors"]
+        scales = collection._state["scales"]
+        report["matrix_mb"] = (vectors.nbytes + (scales.nbytes if scales is not None else 0)) / 1e6
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=5000, help="corpus size")
+    parser.add_argument("--dim", type=int, default=768, help="embedding dimension (embedding-001 is 768)")
+    parser.add_argument("--queries", type=int, default=500, help="queries per backend")
+    parser.add_argument("--top-k", type=int, default=5, help="results per query")
+    parser.add_argument("--skip-chroma", action="store_true", help="only benchmark the NumPy store")
+    args = parser.parse_args()
+
+    corpus, probes = make_dataset(args.vectors, args.dim, args.queries)
+    truth = exact_top_k(corpus, probes, args.top_k)
+
+    backends = [] if args.skip_chroma else [("chroma", None)]
+    backends += [("numpy", "float32"), ("numpy", "float16"), ("numpy", "int8")]
+
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, top-{args.top_k}")
+    print(f"{'backend':<16}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall':>8}{'disk MB':>9}{'matrix MB':>11}")
+    for name, dtype in backends:
+        report = run(name, corpus, probes, truth, args.top_k, dtype)
+        label = name if dtype is None else f"{name}/{dtype}"
+        matrix = f"{report['matrix_mb']:>11.1f}" if "matrix_mb" in report else f"{'-':>11}"
+        print(f"{label:<16}{report['build_s']:>9.2f}{report['p50_ms']:>9.3f}{report['p95_ms']:>9.3f}"
+              f"{report['recall']:>8.3f}{report['disk_mb']:>9.1f}{matrix}")
+
+if __name__ == "__main__":
+    main()
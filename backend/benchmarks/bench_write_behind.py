@@ -0,0 +1,76 @@
+"""
+Chat-turn write benchmark: inline commits vs the write-behind queue
+
+Each simulated turn performs the writes of one /api/chat turn
+(conversation row, user and assistant messages, token usage and title)
+from a pool of worker threads. Throughput includes the final flush, so
+queued writes are counted only once they are committed.
+
+Run from backend/:
+    python -m benchmarks.bench_write_behind --threads 16 --turns 2000
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import db
+
+def chat_turn_writes(user_id: int):
+    """Perform the writes of one chat turn and return its latency"""
+    start = time.perf_counter()
+    conversation_id = str(uuid.uuid4())
+    db.save_conversation_with_user(conversation_id, user_id)
+    db.save_message(conversation_id, "user", "How do I set up IPTV on my firestick?")
+    db.save_token_usage(conversation_id, user_id, 500, 120, 620, 0.0001)
+    db.update_conversation_title(conversation_id, "How do I set up IPTV on my firestick")
+    db.save_message(conversation_id, "assistant", "Here's how to get it running..." * 10)
+    return time.perf_counter() - start
+
+def run(mode: str, threads: int, turns: int, user_id: int) -> dict:
+    if mode == "write-behind":
+        db.write_queue.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(lambda _: chat_turn_writes(user_id), range(turns)))
+    if mode == "write-behind":
+        db.write_queue.stop()
+    wall = time.perf_counter() - start
+
+    return {
+        "throughput": turns / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent writer threads")
+    parser.add_argument("--turns", type=int, default=2000, help="chat turns to write")
+    args = parser.parse_args()
+
+    db.DB_PATH = Path(tempfile.mkdtemp(prefix="write_bench_")) / "bench.db"
+    db.init_database()
+    user_id = db.create_user(f"bench-{uuid.uuid4().hex}@example.com", "Bench", "bench")
+
+    print(f"{args.turns} chat turns from {args.threads} threads")
+    for mode in ("inline", "write-behind"):
+        result = run(mode, args.threads, args.turns, user_id)
+        print(
+            f"{mode:<13} throughput {result['throughput']:8.1f} turns/s  "
+            f"p50 {result['p50_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms"
+        )
+    print(f"write-behind: {db.write_queue.stats['writes']} writes in {db.write_queue.stats['transactions']} transactions")
+
+    db.close_db_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Query-plan regression check for the hot-path database helpers
+
+Builds a fresh database from init_database() (so every migration runs),
+calls each read helper while tracing the SQL it executes, and runs
+EXPLAIN QUERY PLAN on every traced SELECT. Exits non-zero if any plan
+contains a full table scan (a SCAN step that does not use an index).
+
+Run from backend/:
+    python check_query_plans.py
+"""
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+from database import db
+
+# "SCAN messages" / "SCAN m" are table scans; "SCAN t USING COVERING INDEX ..." is not
+TABLE_SCAN = re.compile(r"^SCAN \w+$")
+
+def users_cursor(sort: str) -> str:
+    """A mid-listing cursor, so the keyset condition is part of the traced query"""
+    value = 0 if sort in ("tokens", "cost", "conversations") else "2025-01-01 00:00:00"
+    return db.encode_cursor([value, 1])
+
+def hot_path_calls():
+    """The read helpers whose queries must stay index-backed"""
+    return {
+        "get_conversation_history": lambda: db.get_conversation_history("conversation-id"),
+        "get_conversation_messages": lambda: db.get_conversation_messages("conversation-id"),
+        "get_conversation_messages (cursor)": lambda: db.get_conversation_messages(
+            "conversation-id", cursor=db.encode_cursor(["2025-01-01T00:00:00", 1])
+        ),
+        "get_recent_messages": lambda: db.get_recent_messages("conversation-id", 6),
+        "get_messages_after": lambda: db.get_messages_after("conversation-id", "2025-01-01T00:00:00", 1, 25),
+        "get_conversation_summary": lambda: db.get_conversation_summary("conversation-id"),
+        "get_user_conversations": lambda: db.get_user_conversations(1),
+        "get_user_conversations (cursor)": lambda: db.get_user_conversations(
+            1, cursor=db.encode_cursor(["2025-01-01T00:00:00", "conversation-id"])
+        ),
+        "get_users_page": lambda: db.get_users_page(),
+        "get_users_page (cursor)": lambda: db.get_users_page(cursor=users_cursor("created_at")),
+        "get_users_page (email search)": lambda: db.get_users_page(sort="email", descending=False, email_prefix="ab"),
+        "get_users_page (by cost)": lambda: db.get_users_page(cursor=users_cursor("cost"), sort="cost"),
+        "get_usage_over_time": lambda: db.get_usage_over_time(),
+        "get_total_app_stats": lambda: db.get_total_app_stats(),
+    }
+
+def traced_selects(call) -> list:
+    """Run a helper and return the SELECT statements it executed"""
+    statements = []
+    conn = db.get_db_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+def check_query_plans() -> list:
+    """Return (helper, plan step) pairs for every table scan found"""
+    conn = db.get_db_connection()
+    failures = []
+    for name, call in hot_path_calls().items():
+        for sql in traced_selects(call):
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            for row in plan:
+                detail = row["detail"]
+                status = "FAIL" if TABLE_SCAN.match(detail) else "ok"
+                print(f"  [{status}] {name}: {detail}")
+                if status == "FAIL":
+                    failures.append((name, detail))
+    return failures
+
+def main():
+    db.DB_PATH = Path(tempfile.mkdtemp(prefix="query_plans_")) / "plans.db"
+    db.init_database()
+
+    failures = check_query_plans()
+    db.close_db_connections()
+
+    if failures:
+        print(f"❌ {len(failures)} table scan(s) found in hot-path queries")
+        sys.exit(1)
+    print("✅ No table scans in hot-path queries")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,84 @@
 import sqlite3
 import os
+import base64
+import json
+import threading
 from pathlib import Path
 from datetime import datetime
 from passlib.context import CryptContext
+from .write_behind import WriteBehindQueue
+from .migrations import run_migrations
+from .rollups import (
+    token_usage_statements, new_conversation_statements, rebuild_usage_rollups,
+    NEW_USER_TOTALS, NEW_USER_BY_USER
+)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 DB_PATH = Path(__file__).parent / "chatbot.db"
 
-def get_db_connection():
-    """Get a database connection"""
-    conn = sqlite3.connect(str(DB_PATH))
+# Connection tuning (per connection; see _open_connection)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))  # page cache per connection
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # memory-mapped I/O
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))  # seconds to wait on a locked database
+SQLITE_STATEMENT_CACHE = 256  # prepared statements cached per connection
+
+# One long-lived connection per thread; the thread pools in services/executor.py
+# bound how many exist at once
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # bumped by close_db_connections() so threads reopen
+
+def _open_connection(path: Path) -> sqlite3.Connection:
+    """Open and tune a new connection"""
+    conn = sqlite3.connect(
+        str(path),
+        timeout=SQLITE_BUSY_TIMEOUT,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+        check_same_thread=False  # only so close_db_connections() can close it at shutdown
+    )
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run while a writer commits; NORMAL sync is durable across app crashes in WAL mode
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_db_connection():
+    """
+    Get this thread's database connection
+
+    Connections are long-lived and reused, so callers must not close them.
+    Use `with conn:` around writes to commit (or roll back) a transaction.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_PATH or _local.generation != _generation:
+        conn = _open_connection(DB_PATH)
+        with _connections_lock:
+            _connections.append(conn)
+            _local.generation = _generation
+        _local.conn = conn
+        _local.path = DB_PATH
     return conn
 
+def close_db_connections():
+    """Close every pooled connection (called on application shutdown)"""
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _generation += 1
+
+# Chat-turn writes go through the write-behind queue (started in main.py's lifespan)
+write_queue = WriteBehindQueue(get_db_connection)
+
 def init_database():
     """Initialize the database with required tables and default data"""
     conn = get_db_connection()
@@ -42,21 +107,6 @@ def init_database():
         )
     """)
     
-    # Migrate existing conversations table if needed
-    try:
-        cursor.execute("SELECT user_id FROM conversations LIMIT 1")
-    except sqlite3.OperationalError:
-        # Column doesn't exist, add it
-        print("Migrating conversations table: adding user_id column")
-        cursor.execute("ALTER TABLE conversations ADD COLUMN user_id INTEGER")
-    
-    try:
-        cursor.execute("SELECT title FROM conversations LIMIT 1")
-    except sqlite3.OperationalError:
-        # Column doesn't exist, add it
-        print("Migrating conversations table: adding title column")
-        cursor.execute("ALTER TABLE conversations ADD COLUMN title TEXT")
-    
     # Create messages table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS messages (
@@ -102,6 +152,11 @@ def init_database():
         )
     """)
     
+    conn.commit()
+    
+    # Apply versioned schema migrations (columns, indexes)
+    run_migrations(conn)
+    
     # Insert default settings if not exist
     default_settings = {
         "welcome_message": "Hello! How can I help you today?",
@@ -126,73 +181,159 @@ def init_database():
     )
     
     conn.commit()
-    conn.close()
     print(f"Database initialized at {DB_PATH}")
 
+# Settings are served from memory and reloaded when the settings_version
+# counter in app_meta changes; save_settings() bumps it, so every worker
+# process picks up admin edits on its next read
+_settings_cache = {"version": None, "values": {}}
+_settings_lock = threading.Lock()
+
+def get_settings_version() -> int:
+    """Counter bumped by every settings update (also the settings' HTTP cache version)"""
+    conn = get_db_connection()
+    return conn.execute("SELECT value FROM app_meta WHERE key = 'settings_version'").fetchone()["value"]
+
+def get_all_settings() -> dict:
+    """Get all settings as a dict, from the in-process cache when it is current"""
+    conn = get_db_connection()
+    # Read the version before the values: a concurrent update then at worst
+    # makes the next call reload again, never caches stale values as current
+    version = get_settings_version()
+    if _settings_cache["version"] != version:
+        rows = conn.execute("SELECT key, value FROM settings").fetchall()
+        with _settings_lock:
+            _settings_cache["values"] = {row["key"]: row["value"] for row in rows}
+            _settings_cache["version"] = version
+    return dict(_settings_cache["values"])
+
 def get_setting(key: str) -> str:
     """Get a setting value by key"""
+    return get_all_settings().get(key)
+
+def save_settings(values: dict):
+    """Update several settings in one transaction"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    result = cursor.fetchone()
-    conn.close()
-    return result["value"] if result else None
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            list(values.items())
+        )
+        conn.execute("UPDATE app_meta SET value = value + 1 WHERE key = 'settings_version'")
 
 def update_setting(key: str, value: str):
     """Update a setting value"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-        (key, value)
-    )
-    conn.commit()
-    conn.close()
+    save_settings({key: value})
 
 def save_conversation(conversation_id: str):
     """Create a new conversation"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO conversations (id, created_at) VALUES (?, ?)",
-        (conversation_id, datetime.now().isoformat())
-    )
-    conn.commit()
-    conn.close()
+    created_at = datetime.now().isoformat()
+    write_queue.submit(new_conversation_statements(conversation_id, None, created_at[:10]) + [(
+        "INSERT OR IGNORE INTO conversations (id, created_at, last_message_at) VALUES (?, ?, ?)",
+        (conversation_id, created_at, created_at)
+    )], key=conversation_id)
 
-def save_message(conversation_id: str, role: str, content: str):
-    """Save a message to the database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-        (conversation_id, role, content, datetime.now().isoformat())
-    )
-    conn.commit()
-    conn.close()
+def user_write_key(user_id: int):
+    """Write-behind key of the writes that change a user's conversation list (None without a user)"""
+    return f"user:{user_id}" if user_id is not None else None
+
+def save_message(conversation_id: str, role: str, content: str, user_id: int = None):
+    """Save a message to the database (and bump the conversation's last_message_at and message_count)"""
+    timestamp = datetime.now().isoformat()
+    write_queue.submit([
+        (
+            "INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            (conversation_id, role, content, timestamp)
+        ),
+        (
+            "UPDATE conversations SET last_message_at = ?, message_count = message_count + 1 WHERE id = ?",
+            (timestamp, conversation_id)
+        )
+    ], key=conversation_id, extra_keys=(user_write_key(user_id),))
 
 def get_conversation_history(conversation_id: str):
     """Get all messages for a conversation"""
+    write_queue.wait_for(conversation_id)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    rows = conn.execute(
         "SELECT role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
         (conversation_id,)
-    )
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return messages
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_recent_messages(conversation_id: str, limit: int, before: tuple = None):
+    """Get the last `limit` messages of a conversation (before a (timestamp, id) position if given), oldest first"""
+    write_queue.wait_for(conversation_id)
+    conn = get_db_connection()
+    if before is None:
+        rows = conn.execute("""
+            SELECT id, role, content, timestamp
+            FROM messages
+            WHERE conversation_id = ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (conversation_id, limit)).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT id, role, content, timestamp
+            FROM messages
+            WHERE conversation_id = ? AND (timestamp, id) < (?, ?)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (conversation_id, before[0], before[1], limit)).fetchall()
+    return [dict(row) for row in reversed(rows)]
+
+def get_messages_after(conversation_id: str, timestamp: str = None, message_id: int = 0, limit: int = 100):
+    """Get up to `limit` messages that come after (timestamp, message_id), oldest first"""
+    write_queue.wait_for(conversation_id)
+    conn = get_db_connection()
+    if timestamp is None:
+        rows = conn.execute("""
+            SELECT id, role, content, timestamp
+            FROM messages
+            WHERE conversation_id = ?
+            ORDER BY timestamp, id
+            LIMIT ?
+        """, (conversation_id, limit)).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT id, role, content, timestamp
+            FROM messages
+            WHERE conversation_id = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id
+            LIMIT ?
+        """, (conversation_id, timestamp, message_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+def get_conversation_summary(conversation_id: str):
+    """Get the rolling summary of a conversation's older messages (None if there is none yet)"""
+    write_queue.wait_for(conversation_id)
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT summary, last_message_timestamp, last_message_id, summarized_messages, updated_at
+        FROM conversation_summaries
+        WHERE conversation_id = ?
+    """, (conversation_id,)).fetchone()
+    return dict(row) if row else None
+
+def save_conversation_summary(conversation_id: str, summary: str, last_message_timestamp: str, last_message_id: int, summarized_messages: int):
+    """Replace the rolling summary of a conversation"""
+    write_queue.submit([(
+        """
+        INSERT OR REPLACE INTO conversation_summaries
+            (conversation_id, summary, last_message_timestamp, last_message_id, summarized_messages, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (conversation_id, summary, last_message_timestamp, last_message_id, summarized_messages, datetime.now().isoformat())
+    )], key=conversation_id)
 
 def verify_admin_credentials(username: str, password: str) -> bool:
     """Verify admin login credentials"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    result = conn.execute(
         "SELECT hashed_password FROM admin_users WHERE username = ?",
         (username,)
-    )
-    result = cursor.fetchone()
-    conn.close()
+    ).fetchone()
     
     if result is None:
         return False
@@ -203,24 +344,20 @@ def verify_admin_credentials(username: str, password: str) -> bool:
 def create_user(email: str, name: str, password: str) -> int:
     """Create a new user"""
     conn = get_db_connection()
-    cursor = conn.cursor()
     hashed_password = pwd_context.hash(password)
-    cursor.execute(
-        "INSERT INTO users (email, name, hashed_password) VALUES (?, ?, ?)",
-        (email, name, hashed_password)
-    )
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return user_id
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO users (email, name, hashed_password) VALUES (?, ?, ?)",
+            (email, name, hashed_password)
+        )
+        conn.execute(NEW_USER_TOTALS)
+        conn.execute(NEW_USER_BY_USER, (cursor.lastrowid,))
+    return cursor.lastrowid
 
 def get_user_by_email(email: str):
     """Get user by email"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-    result = cursor.fetchone()
-    conn.close()
+    result = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
     return dict(result) if result else None
 
 def verify_user_credentials(email: str, password: str):
@@ -233,141 +370,251 @@ def verify_user_credentials(email: str, password: str):
         return user
     return None
 
-def get_user_conversations(user_id: int):
-    """Get all conversations for a user"""
+# Keyset cursors are opaque to clients: base64 of the last row's sort values
+def encode_cursor(values: list) -> str:
+    """Opaque keyset cursor for a list of JSON values"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for a cursor this module did not produce"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+def get_user_conversations(user_id: int, limit: int = 50, cursor: str = None) -> dict:
+    """
+    Get one page of a user's conversations, most recently active first
+
+    Keyset-paginated on (last_message_at, id); pass the previous page's
+    next_cursor to continue. Returns {"conversations": [...], "next_cursor": str or None}.
+    """
+    write_queue.wait_for(user_write_key(user_id))
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT c.id, c.title, c.created_at, 
-               COUNT(m.id) as message_count,
-               MAX(m.timestamp) as last_message_at
-        FROM conversations c
-        LEFT JOIN messages m ON c.id = m.conversation_id
-        WHERE c.user_id = ?
-        GROUP BY c.id
-        ORDER BY last_message_at DESC
-    """, (user_id,))
-    conversations = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return conversations
+    if cursor:
+        last_message_at, conversation_id = decode_cursor(cursor)
+        rows = conn.execute("""
+            SELECT id, title, created_at, message_count, last_message_at
+            FROM conversations
+            WHERE user_id = ? AND (last_message_at, id) < (?, ?)
+            ORDER BY last_message_at DESC, id DESC
+            LIMIT ?
+        """, (user_id, last_message_at, conversation_id, limit + 1)).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT id, title, created_at, message_count, last_message_at
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY last_message_at DESC, id DESC
+            LIMIT ?
+        """, (user_id, limit + 1)).fetchall()
+
+    conversations = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([conversations[-1]["last_message_at"], conversations[-1]["id"]])
+    return {"conversations": conversations, "next_cursor": next_cursor}
 
 def save_conversation_with_user(conversation_id: str, user_id: int, title: str = None):
-    """Create a new conversation for a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO conversations (id, user_id, title, created_at) VALUES (?, ?, ?, ?)",
-        (conversation_id, user_id, title or "New Conversation", datetime.now().isoformat())
-    )
-    conn.commit()
-    conn.close()
+    """Create a new conversation for a user (and count it in the usage rollups)"""
+    created_at = datetime.now().isoformat()
+    write_queue.submit(new_conversation_statements(conversation_id, user_id, created_at[:10]) + [(
+        "INSERT OR IGNORE INTO conversations (id, user_id, title, created_at, last_message_at) VALUES (?, ?, ?, ?, ?)",
+        (conversation_id, user_id, title or "New Conversation", created_at, created_at)
+    )], key=conversation_id, extra_keys=(user_write_key(user_id),))
 
-def update_conversation_title(conversation_id: str, title: str):
+def update_conversation_title(conversation_id: str, title: str, user_id: int = None):
     """Update conversation title"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    write_queue.submit([(
         "UPDATE conversations SET title = ? WHERE id = ?",
         (title, conversation_id)
-    )
-    conn.commit()
-    conn.close()
+    )], key=conversation_id, extra_keys=(user_write_key(user_id),))
 
-def get_conversation_messages(conversation_id: str):
-    """Get all messages for a conversation"""
+def get_conversations_version(user_id: int):
+    """When the user's conversation list last changed (None if they have none)"""
+    write_queue.wait_for(user_write_key(user_id))
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT role, content, timestamp
-        FROM messages
-        WHERE conversation_id = ?
-        ORDER BY timestamp ASC
-    """, (conversation_id,))
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return messages
-
-def save_token_usage(conversation_id: str, user_id: int, prompt_tokens: int, completion_tokens: int, total_tokens: int, cost: float):
-    """Save token usage information"""
+    return conn.execute(
+        "SELECT MAX(last_message_at) as last_message_at FROM conversations WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()["last_message_at"]
+
+def get_conversation_version(conversation_id: str):
+    """A conversation's last_message_at and message_count (None if it does not exist)"""
+    write_queue.wait_for(conversation_id)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO token_usage (conversation_id, user_id, prompt_tokens, completion_tokens, total_tokens, cost, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (conversation_id, user_id, prompt_tokens, completion_tokens, total_tokens, cost, datetime.now().isoformat()))
-    
-    # Update user's total tokens
-    cursor.execute("""
-        UPDATE users SET total_tokens_used = total_tokens_used + ? WHERE id = ?
-    """, (total_tokens, user_id))
-    
-    conn.commit()
-    conn.close()
+    row = conn.execute(
+        "SELECT last_message_at, message_count FROM conversations WHERE id = ?",
+        (conversation_id,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def get_conversation_messages(conversation_id: str, limit: int = 50, cursor: str = None, since: int = None) -> dict:
+    """
+    Get one page of a conversation's messages, oldest first
+
+    - Without cursor or since: the latest `limit` messages
+    - cursor: the `limit` messages before the previous page (its next_cursor)
+    - since: the messages after message id `since`, for clients that already
+      have everything up to it; has_more is True if more than `limit` remain
+
+    Returns {"messages": [...], "next_cursor": str or None} or, with since,
+    {"messages": [...], "has_more": bool}. Raises ValueError for an unknown
+    cursor or message id.
+    """
+    if since is not None:
+        write_queue.wait_for(conversation_id)
+        conn = get_db_connection()
+        row = conn.execute(
+            "SELECT timestamp FROM messages WHERE id = ? AND conversation_id = ?",
+            (since, conversation_id)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Message {since} is not in this conversation")
+        messages = get_messages_after(conversation_id, row["timestamp"], since, limit + 1)
+        return {"messages": messages[:limit], "has_more": len(messages) > limit}
+
+    before = tuple(decode_cursor(cursor)) if cursor else None
+    messages = get_recent_messages(conversation_id, limit + 1, before)
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[1:]
+        next_cursor = encode_cursor([messages[0]["timestamp"], messages[0]["id"]])
+    return {"messages": messages, "next_cursor": next_cursor}
+
+def save_token_usage(conversation_id: str, user_id: int, prompt_tokens: int, completion_tokens: int, total_tokens: int, cost: float, cache_hit: bool = False):
+    """Save token usage information (cache_hit marks answers served from the semantic cache or a shared in-flight call)"""
+    timestamp = datetime.now().isoformat()
+    write_queue.submit([
+        ("""
+            INSERT INTO token_usage (conversation_id, user_id, prompt_tokens, completion_tokens, total_tokens, cost, cache_hit, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (conversation_id, user_id, prompt_tokens, completion_tokens, total_tokens, cost, int(cache_hit), timestamp)),
+        
+        # Update user's total tokens
+        ("""
+            UPDATE users SET total_tokens_used = total_tokens_used + ? WHERE id = ?
+        """, (total_tokens, user_id))
+    ] + token_usage_statements(user_id, timestamp[:10], total_tokens, cost, cache_hit), key=conversation_id)
+
+# Sortable users listing columns: (sort column, tie-breaker). Counter sorts are
+# driven from usage_by_user so they walk its (counter, user_id) indexes
+USER_SORTS = {
+    "created_at": ("u.created_at", "u.id"),
+    "email": ("u.email", "u.id"),
+    "tokens": ("r.tokens", "r.user_id"),
+    "cost": ("r.cost", "r.user_id"),
+    "conversations": ("r.conversations", "r.user_id"),
+}
+
+def get_users_page(limit: int = 50, cursor: str = None, sort: str = "created_at", descending: bool = True, email_prefix: str = None) -> dict:
+    """
+    Get one page of users with their stats
+
+    Pages are keyset-paginated on (sort column, user id), so every page is an
+    index range read however deep it is.
+
+    Args:
+        limit: Users per page
+        cursor: next_cursor of the previous page (None for the first page)
+        sort: A key of USER_SORTS
+        descending: Sort direction
+        email_prefix: Only users whose email starts with this (case-sensitive)
+
+    Returns:
+        {"users": [...], "next_cursor": str or None}
+    """
+    if sort not in USER_SORTS:
+        raise ValueError(f"Unknown sort '{sort}' (allowed: {', '.join(USER_SORTS)})")
+    column, tie_breaker = USER_SORTS[sort]
+    if column.startswith("r."):
+        source = "usage_by_user r JOIN users u ON u.id = r.user_id"
+    else:
+        source = "users u LEFT JOIN usage_by_user r ON r.user_id = u.id"
+
+    conditions, params = [], []
+    if email_prefix:
+        # A range on the email index; LIKE would scan
+        conditions.append("u.email >= ? AND u.email < ?")
+        params += [email_prefix, email_prefix[:-1] + chr(ord(email_prefix[-1]) + 1)]
+    if cursor:
+        conditions.append(f"({column}, {tie_breaker}) {'<' if descending else '>'} (?, ?)")
+        params += decode_cursor(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    direction = "DESC" if descending else "ASC"
 
-def get_all_users_with_stats():
-    """Get all users with their stats"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+    rows = conn.execute(f"""
         SELECT 
             u.id, u.email, u.name, u.created_at, u.total_tokens_used,
-            COUNT(DISTINCT c.id) as conversation_count,
-            SUM(t.cost) as total_cost
-        FROM users u
-        LEFT JOIN conversations c ON u.id = c.user_id
-        LEFT JOIN token_usage t ON u.id = t.user_id
-        GROUP BY u.id
-        ORDER BY u.created_at DESC
-    """)
-    users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return users
+            COALESCE(r.conversations, 0) as conversation_count,
+            COALESCE(r.cost, 0.0) as total_cost,
+            {column} as sort_value
+        FROM {source}
+        {where}
+        ORDER BY {column} {direction}, {tie_breaker} {direction}
+        LIMIT ?
+    """, params + [limit + 1]).fetchall()
+
+    users = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([users[-1]["sort_value"], users[-1]["id"]])
+    for user in users:
+        del user["sort_value"]
+    return {"users": users, "next_cursor": next_cursor}
+
+def get_usage_version() -> str:
+    """Changes whenever the usage rollups do (every token_usage row, conversation and user bumps a counter)"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT requests, conversations, users FROM usage_totals WHERE id = 1").fetchone()
+    return f"{row['requests']}-{row['conversations']}-{row['users']}"
 
 def get_total_app_stats():
-    """Get total application statistics"""
+    """Get total application statistics (one row of the usage_totals rollup)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Total tokens
-    cursor.execute("SELECT SUM(total_tokens_used) as total_tokens FROM users")
-    total_tokens = cursor.fetchone()["total_tokens"] or 0
-    
-    # Total cost
-    cursor.execute("SELECT SUM(cost) as total_cost FROM token_usage")
-    total_cost = cursor.fetchone()["total_cost"] or 0.0
+    totals = conn.execute("""
+        SELECT tokens, cost, requests, cache_hits, generated_cost, users, conversations
+        FROM usage_totals
+        WHERE id = 1
+    """).fetchone()
     
-    # Total users
-    cursor.execute("SELECT COUNT(*) as total_users FROM users")
-    total_users = cursor.fetchone()["total_users"]
+    # Semantic cache hits and the estimated cost they saved (at the average cost of a generated answer)
+    generated = totals["requests"] - totals["cache_hits"]
+    avg_cost = totals["generated_cost"] / generated if generated else 0.0
     
-    # Total conversations
-    cursor.execute("SELECT COUNT(*) as total_conversations FROM conversations")
-    total_conversations = cursor.fetchone()["total_conversations"]
-    
-    conn.close()
     return {
-        "total_tokens": total_tokens,
-        "total_cost": round(total_cost, 4),
-        "total_users": total_users,
-        "total_conversations": total_conversations
+        "total_tokens": totals["tokens"],
+        "total_cost": round(totals["cost"], 4),
+        "total_users": totals["users"],
+        "total_conversations": totals["conversations"],
+        "cache_hits": totals["cache_hits"],
+        "estimated_cache_savings": round(totals["cache_hits"] * avg_cost, 4)
     }
 
 def get_usage_over_time():
-    """Get token usage over time for graphs"""
+    """Get token usage over time for graphs (last 30 days of the usage_daily rollup)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT 
-            DATE(timestamp) as date,
-            SUM(total_tokens) as tokens,
-            SUM(cost) as cost,
-            COUNT(*) as requests
-        FROM token_usage
-        GROUP BY DATE(timestamp)
+    rows = conn.execute("""
+        SELECT date, tokens, cost, requests, cache_hits
+        FROM usage_daily
         ORDER BY date DESC
         LIMIT 30
-    """)
-    data = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return data
+    """).fetchall()
+    return [dict(row) for row in rows]
 
+def rebuild_rollups():
+    """Recompute the usage rollups from the raw tables (after manual edits or imports)"""
+    write_queue.flush()
+    conn = get_db_connection()
+    # IMMEDIATE takes the write lock up front so no chat write lands mid-rebuild
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild_usage_rollups(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
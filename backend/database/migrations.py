@@ -0,0 +1,154 @@
+"""
+Versioned schema migrations
+
+The schema version is stored in SQLite's `PRAGMA user_version`. Each
+migration runs once, in order, inside its own transaction, and bumps the
+version when it succeeds. To change the schema, append a new
+(version, description, steps) entry to MIGRATIONS; never edit one that
+has already shipped.
+
+A step is either an SQL string or a function taking the connection.
+"""
+
+import sqlite3
+from .rollups import rebuild_usage_rollups
+
+def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+def _add_conversation_user_columns(conn: sqlite3.Connection):
+    """Columns added before migrations were versioned (older databases lack them)"""
+    if not _column_exists(conn, "conversations", "user_id"):
+        print("Migrating conversations table: adding user_id column")
+        conn.execute("ALTER TABLE conversations ADD COLUMN user_id INTEGER")
+    if not _column_exists(conn, "conversations", "title"):
+        print("Migrating conversations table: adding title column")
+        conn.execute("ALTER TABLE conversations ADD COLUMN title TEXT")
+
+MIGRATIONS = [
+    (1, "conversations.user_id and conversations.title", [
+        _add_conversation_user_columns,
+    ]),
+    (2, "indexes for hot-path queries", [
+        # get_conversation_history / get_conversation_messages, and the messages join in get_user_conversations
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp ON messages(conversation_id, timestamp)",
+        # get_user_conversations and the conversations join in get_all_users_with_stats
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user_id)",
+        # token_usage join in get_all_users_with_stats (covers SUM(cost))
+        "CREATE INDEX IF NOT EXISTS idx_token_usage_user_cost ON token_usage(user_id, cost)",
+        # get_usage_over_time daily grouping (covering expression index)
+        "CREATE INDEX IF NOT EXISTS idx_token_usage_date ON token_usage(DATE(timestamp), total_tokens, cost)",
+        # get_all_users_with_stats ordering
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)",
+    ]),
+    (3, "app_meta table with settings version counter", [
+        "CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)",
+        "INSERT OR IGNORE INTO app_meta (key, value) VALUES ('settings_version', 0)",
+    ]),
+    (4, "token_usage.cache_hit for answers served from the semantic cache", [
+        "ALTER TABLE token_usage ADD COLUMN cache_hit INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (5, "conversation_summaries table for rolling conversation memory", [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_message_timestamp TIMESTAMP NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            summarized_messages INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        )
+        """,
+    ]),
+    (6, "usage rollup tables for the admin stats and usage graph", [
+        """
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            date TEXT PRIMARY KEY,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0.0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            cache_hits INTEGER NOT NULL DEFAULT 0,
+            generated_cost REAL NOT NULL DEFAULT 0.0,
+            conversations INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS usage_by_user (
+            user_id INTEGER PRIMARY KEY,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0.0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            cache_hits INTEGER NOT NULL DEFAULT 0,
+            conversations INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS usage_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            tokens INTEGER NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0.0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            cache_hits INTEGER NOT NULL DEFAULT 0,
+            generated_cost REAL NOT NULL DEFAULT 0.0,
+            users INTEGER NOT NULL DEFAULT 0,
+            conversations INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # Backfill from the existing history
+        rebuild_usage_rollups,
+    ]),
+    (7, "indexes for the paginated, sortable users listing", [
+        # Users created before the rollups gave every user a row
+        "INSERT OR IGNORE INTO usage_by_user (user_id) SELECT id FROM users",
+        # Keyset order (value, user_id) for each sortable counter; the rowid is implicit
+        "CREATE INDEX IF NOT EXISTS idx_usage_by_user_tokens ON usage_by_user(tokens)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_by_user_cost ON usage_by_user(cost)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_by_user_conversations ON usage_by_user(conversations)",
+    ]),
+    (8, "conversations.last_message_at and message_count for paginated conversation lists", [
+        "ALTER TABLE conversations ADD COLUMN last_message_at TIMESTAMP",
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+        # Conversations without messages sort by when they were created
+        """
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id),
+            last_message_at = COALESCE(
+                (SELECT MAX(m.timestamp) FROM messages m WHERE m.conversation_id = conversations.id),
+                created_at
+            )
+        """,
+        # get_user_conversations keyset order (last_message_at, id) per user
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_last_message ON conversations(user_id, last_message_at, id)",
+    ]),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn: sqlite3.Connection):
+    """Apply every migration newer than the database's schema version"""
+    for version, description, steps in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        # sqlite3 does not open transactions for DDL on its own, so begin one
+        # explicitly to make each migration all-or-nothing. IMMEDIATE takes the
+        # write lock up front so concurrent workers apply each migration once.
+        conn.execute("BEGIN IMMEDIATE")
+        if version <= get_schema_version(conn):
+            conn.rollback()
+            continue
+        print(f"Applying migration {version}: {description}")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            # PRAGMA does not accept bound parameters
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
@@ -0,0 +1,136 @@
+"""
+Pre-aggregated usage counters for the admin dashboard
+
+Three rollup tables hold running totals, so the admin stats and the usage
+graph read a fixed number of rows however much history is kept:
+- usage_daily: tokens, cost, requests, cache hits and new conversations per day
+- usage_by_user: the same counters per user (a row for every user)
+- usage_totals: one row with the app-wide counters (plus the user count)
+
+The counters are bumped by the same write-behind statements that insert
+token_usage and conversations rows (see db.save_token_usage and
+db.save_conversation_with_user), so each one commits atomically with the
+row it counts. rebuild_usage_rollups() recomputes everything from the raw
+tables; migration 6 runs it once, and rebuild_rollups.py runs it on demand.
+"""
+
+import sqlite3
+
+# Each delta statement adds to an existing row or creates it
+USAGE_DAILY_DELTA = """
+    INSERT INTO usage_daily (date, tokens, cost, requests, cache_hits, generated_cost)
+    VALUES (?, ?, ?, 1, ?, ?)
+    ON CONFLICT(date) DO UPDATE SET
+        tokens = tokens + excluded.tokens,
+        cost = cost + excluded.cost,
+        requests = requests + 1,
+        cache_hits = cache_hits + excluded.cache_hits,
+        generated_cost = generated_cost + excluded.generated_cost
+"""
+
+USAGE_BY_USER_DELTA = """
+    INSERT INTO usage_by_user (user_id, tokens, cost, requests, cache_hits)
+    VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        tokens = tokens + excluded.tokens,
+        cost = cost + excluded.cost,
+        requests = requests + 1,
+        cache_hits = cache_hits + excluded.cache_hits
+"""
+
+USAGE_TOTALS_DELTA = """
+    UPDATE usage_totals SET
+        tokens = tokens + ?,
+        cost = cost + ?,
+        requests = requests + 1,
+        cache_hits = cache_hits + ?,
+        generated_cost = generated_cost + ?
+    WHERE id = 1
+"""
+
+# New-conversation counters run before the conversation's INSERT OR IGNORE
+# and only count it if the row does not exist yet
+NEW_CONVERSATION_DAILY = """
+    INSERT INTO usage_daily (date, conversations)
+    SELECT ?, 1 WHERE NOT EXISTS (SELECT 1 FROM conversations WHERE id = ?)
+    ON CONFLICT(date) DO UPDATE SET conversations = conversations + 1
+"""
+
+NEW_CONVERSATION_BY_USER = """
+    INSERT INTO usage_by_user (user_id, conversations)
+    SELECT ?, 1 WHERE NOT EXISTS (SELECT 1 FROM conversations WHERE id = ?)
+    ON CONFLICT(user_id) DO UPDATE SET conversations = conversations + 1
+"""
+
+NEW_CONVERSATION_TOTALS = """
+    UPDATE usage_totals SET conversations = conversations + 1
+    WHERE id = 1 AND NOT EXISTS (SELECT 1 FROM conversations WHERE id = ?)
+"""
+
+NEW_USER_TOTALS = "UPDATE usage_totals SET users = users + 1 WHERE id = 1"
+
+# Every user has a usage_by_user row, so listings sorted by its counters include idle users
+NEW_USER_BY_USER = "INSERT OR IGNORE INTO usage_by_user (user_id) VALUES (?)"
+
+def token_usage_statements(user_id: int, date: str, total_tokens: int, cost: float, cache_hit: bool) -> list:
+    """Rollup updates for one token_usage row"""
+    generated_cost = 0.0 if cache_hit else cost
+    statements = [
+        (USAGE_DAILY_DELTA, (date, total_tokens, cost, int(cache_hit), generated_cost)),
+        (USAGE_TOTALS_DELTA, (total_tokens, cost, int(cache_hit), generated_cost)),
+    ]
+    if user_id is not None:
+        statements.append((USAGE_BY_USER_DELTA, (user_id, total_tokens, cost, int(cache_hit))))
+    return statements
+
+def new_conversation_statements(conversation_id: str, user_id: int, date: str) -> list:
+    """Rollup updates for a conversation row about to be inserted (no-ops if it exists)"""
+    statements = [
+        (NEW_CONVERSATION_DAILY, (date, conversation_id)),
+        (NEW_CONVERSATION_TOTALS, (conversation_id,)),
+    ]
+    if user_id is not None:
+        statements.append((NEW_CONVERSATION_BY_USER, (user_id, conversation_id)))
+    return statements
+
+def rebuild_usage_rollups(conn: sqlite3.Connection):
+    """Recompute every rollup from users, conversations and token_usage (call inside a transaction)"""
+    conn.execute("DELETE FROM usage_daily")
+    conn.execute("DELETE FROM usage_by_user")
+    conn.execute("DELETE FROM usage_totals")
+
+    conn.execute("""
+        INSERT INTO usage_daily (date, tokens, cost, requests, cache_hits, generated_cost)
+        SELECT DATE(timestamp), SUM(total_tokens), SUM(cost), COUNT(*), SUM(cache_hit),
+               SUM(CASE WHEN cache_hit = 0 THEN cost ELSE 0 END)
+        FROM token_usage
+        GROUP BY DATE(timestamp)
+    """)
+    conn.execute("""
+        INSERT INTO usage_daily (date, conversations)
+        SELECT DATE(created_at), COUNT(*) FROM conversations WHERE true GROUP BY DATE(created_at)
+        ON CONFLICT(date) DO UPDATE SET conversations = excluded.conversations
+    """)
+
+    conn.execute("""
+        INSERT INTO usage_by_user (user_id, tokens, cost, requests, cache_hits)
+        SELECT user_id, SUM(total_tokens), SUM(cost), COUNT(*), SUM(cache_hit)
+        FROM token_usage
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    """)
+    conn.execute("""
+        INSERT INTO usage_by_user (user_id, conversations)
+        SELECT user_id, COUNT(*) FROM conversations WHERE user_id IS NOT NULL GROUP BY user_id
+        ON CONFLICT(user_id) DO UPDATE SET conversations = excluded.conversations
+    """)
+    conn.execute("INSERT OR IGNORE INTO usage_by_user (user_id) SELECT id FROM users")
+
+    conn.execute("""
+        INSERT INTO usage_totals (id, tokens, cost, requests, cache_hits, generated_cost, users, conversations)
+        SELECT 1,
+               COALESCE(SUM(tokens), 0), COALESCE(SUM(cost), 0.0), COALESCE(SUM(requests), 0),
+               COALESCE(SUM(cache_hits), 0), COALESCE(SUM(generated_cost), 0.0),
+               (SELECT COUNT(*) FROM users), COALESCE(SUM(conversations), 0)
+        FROM usage_daily
+    """)
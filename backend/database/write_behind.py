@@ -0,0 +1,153 @@
+"""
+Write-behind queue for chat-turn side effects
+
+Requests enqueue their writes (conversation rows, messages, token usage,
+titles) and return immediately. A single background writer thread drains
+the queue and commits everything that has accumulated in one transaction,
+so a burst of turns costs one commit instead of one per statement.
+
+- Bounded memory: submit() blocks once max_pending writes are waiting
+- Read-your-writes: wait_for(key) blocks until every write queued under
+  that key (a conversation id, or a user's key for writes that change their
+  conversation list) is committed; flush() waits for everything
+- Order is preserved: writes commit in the order they were submitted
+- When the writer is not running (scripts, tests), writes run inline
+"""
+
+import os
+import threading
+from collections import deque
+
+WRITE_QUEUE_MAX_PENDING = int(os.getenv("WRITE_QUEUE_MAX_PENDING", "10000"))
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "500"))
+
+class WriteBehindQueue:
+    """Buffers write operations and commits them in grouped transactions"""
+
+    def __init__(self, connection_factory, max_pending: int = WRITE_QUEUE_MAX_PENDING, batch_size: int = WRITE_QUEUE_BATCH_SIZE):
+        self._connection_factory = connection_factory
+        self._max_pending = max_pending
+        self._batch_size = batch_size
+        self._pending = deque()
+        self._pending_by_key = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._submitted = 0
+        self._committed = 0
+        self.stats = {"writes": 0, "transactions": 0, "failed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """Start the background writer thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush all pending writes and stop the writer thread"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, statements: list, key: str = None, extra_keys: tuple = ()):
+        """
+        Queue a write made of one or more (sql, params) statements
+
+        The statements of a single write always commit together. wait_for()
+        on key or any of extra_keys waits for it. Blocks while the queue is
+        full.
+        """
+        keys = tuple(k for k in (key, *extra_keys) if k is not None)
+        with self._cond:
+            while len(self._pending) >= self._max_pending and self._running:
+                self._cond.wait()
+            if self._running:
+                self._pending.append((statements, keys))
+                self._submitted += 1
+                for k in keys:
+                    self._pending_by_key[k] = self._pending_by_key.get(k, 0) + 1
+                self._cond.notify_all()
+                return
+        self._execute_inline(statements)
+
+    def wait_for(self, key: str):
+        """Block until every queued write for key has been committed"""
+        with self._cond:
+            while self._pending_by_key.get(key) and self._running:
+                self._cond.wait()
+
+    def flush(self):
+        """Block until every write submitted so far has been committed"""
+        with self._cond:
+            target = self._submitted
+            while self._committed < target and self._running:
+                self._cond.wait()
+
+    def _execute_inline(self, statements: list):
+        conn = self._connection_factory()
+        with conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and self._running:
+                    self._cond.wait()
+                if not self._pending and not self._running:
+                    return
+                batch = [self._pending.popleft() for _ in range(min(self._batch_size, len(self._pending)))]
+                # Wake producers blocked on a full queue
+                self._cond.notify_all()
+
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                # Keep the writer alive: waiters depend on the counters below advancing
+                self.stats["failed"] += len(batch)
+                print(f"Write-behind dropped batch of {len(batch)}: {e}")
+
+            with self._cond:
+                self._committed += len(batch)
+                for _, keys in batch:
+                    for key in keys:
+                        remaining = self._pending_by_key[key] - 1
+                        if remaining:
+                            self._pending_by_key[key] = remaining
+                        else:
+                            del self._pending_by_key[key]
+                self._cond.notify_all()
+
+    def _commit_batch(self, batch: list):
+        """Commit a batch in one transaction, falling back to one transaction per write on error"""
+        try:
+            conn = self._connection_factory()
+            with conn:
+                for statements, _ in batch:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+            self.stats["writes"] += len(batch)
+            self.stats["transactions"] += 1
+            return
+        except Exception as e:
+            print(f"Write-behind batch of {len(batch)} failed, retrying individually: {e}")
+
+        for statements, keys in batch:
+            try:
+                self._execute_inline(statements)
+                self.stats["writes"] += 1
+                self.stats["transactions"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Write-behind dropped write for {', '.join(keys) or 'no key'}: {e}")
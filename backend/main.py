@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from database.db import init_database
+from database.db import init_database, close_db_connections, write_queue
 from services.rag_service import initialize_rag
+from services.executor import shutdown_pools
+from services.http_cache import CompressionMiddleware
 from routes import chat, admin, conversation, user
 
 @asynccontextmanager
@@ -11,6 +13,7 @@ async def lifespan(app: FastAPI):
     # Startup
     print("Initializing database...")
     init_database()
+    write_queue.start()
     
     print("Initializing RAG system...")
     initialize_rag()
@@ -20,6 +23,10 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    shutdown_pools()
+    print("Flushing pending database writes...")
+    write_queue.stop()
+    close_db_connections()
     print("Application shutdown")
 
 # Create FastAPI app
@@ -39,6 +46,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress complete responses above COMPRESSION_MIN_SIZE (brotli or gzip); SSE streams pass through
+app.add_middleware(CompressionMiddleware)
+
 # Include routers
 app.include_router(chat.router)
 app.include_router(admin.router)
@@ -0,0 +1,28 @@
+"""
+Rebuild the usage rollup tables from the raw history
+
+The rollups (usage_daily, usage_by_user, usage_totals) are kept up to date
+on every chat write and backfilled by migration 6. Run this after editing
+or importing users, conversations or token_usage rows by hand, or to check
+that the counters still match the history. Safe to run while the server is
+up: the rebuild is one transaction.
+
+Run from backend/:
+    python rebuild_rollups.py
+"""
+from database import db
+
+def main():
+    db.init_database()
+    before = db.get_total_app_stats()
+    db.rebuild_rollups()
+    after = db.get_total_app_stats()
+    db.close_db_connections()
+
+    for key, value in after.items():
+        status = "ok" if before[key] == value else f"was {before[key]}"
+        print(f"  {key}: {value} ({status})")
+    print("✅ Usage rollups rebuilt")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,29 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from models.settings import Settings, LoginRequest, LoginResponse
 from database.db import (
-    get_setting, update_setting, verify_admin_credentials,
-    get_all_users_with_stats, get_total_app_stats, get_usage_over_time
+    get_all_settings, save_settings, verify_admin_credentials,
+    get_users_page, get_total_app_stats, get_usage_over_time,
+    get_settings_version, get_usage_version, write_queue
 )
+from services.embedding_service import embedding_cache
+from services.answer_cache import answer_cache
+from services.rag_service import start_reindex_job, get_retrieval_stats
+from services.documents import DOCUMENTS_DIR, SUPPORTED_EXTENSIONS
+from services.ingestion import get_job
+from services.single_flight import get_single_flight_stats
+from services.upstream import get_upstream_stats
+from services.pipeline import get_pipeline_stats
+from services.memory import get_memory_stats
+from services.prompt_builder import get_prompt_stats
+from services.http_cache import (
+    cached_json, make_etag, get_http_cache_stats,
+    SETTINGS_CACHE_CONTROL, PRIVATE_REVALIDATE
+)
+from pathlib import Path
+from typing import List, Optional
 import os
 
 router = APIRouter()
@@ -17,6 +34,9 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# Largest page served by /api/admin/users
+USERS_PAGE_MAX = 200
+
 def create_access_token(data: dict):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -62,19 +82,23 @@ async def login(request: LoginRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/admin/settings", response_model=Settings)
-async def get_settings():
+async def get_settings(request: Request):
     """
     Get admin settings (public endpoint for welcome messages)
     """
     try:
-        welcome_message = get_setting("welcome_message")
-        fallback_message = get_setting("fallback_message")
-        tone_instructions = get_setting("tone_instructions")
+        def build():
+            settings = get_all_settings()
+            return Settings(
+                welcome_message=settings.get("welcome_message"),
+                fallback_message=settings.get("fallback_message"),
+                tone_instructions=settings.get("tone_instructions")
+            ).model_dump()
         
-        return Settings(
-            welcome_message=welcome_message,
-            fallback_message=fallback_message,
-            tone_instructions=tone_instructions
+        return await cached_json(
+            request, build,
+            etag=make_etag("settings", get_settings_version()),
+            cache_control=SETTINGS_CACHE_CONTROL
         )
     
     except Exception as e:
@@ -87,9 +111,11 @@ async def update_settings(settings: Settings, username: str = Depends(verify_tok
     Update admin settings
     """
     try:
-        update_setting("welcome_message", settings.welcome_message)
-        update_setting("fallback_message", settings.fallback_message)
-        update_setting("tone_instructions", settings.tone_instructions)
+        save_settings({
+            "welcome_message": settings.welcome_message,
+            "fallback_message": settings.fallback_message,
+            "tone_instructions": settings.tone_instructions
+        })
         
         return settings
     
@@ -98,37 +124,136 @@ async def update_settings(settings: Settings, username: str = Depends(verify_tok
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/admin/users")
-async def get_users(username: str = Depends(verify_token)):
+async def get_users(
+    request: Request,
+    limit: int = Query(50, ge=1, le=USERS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    search: Optional[str] = None,
+    username: str = Depends(verify_token)
+):
     """
-    Get all users with statistics
+    Get one page of users with statistics, sorted and filtered by email prefix
     """
     try:
-        users = get_all_users_with_stats()
-        return {"users": users}
+        return await cached_json(
+            request, lambda: get_users_page(limit, cursor, sort, order == "desc", search),
+            etag=make_etag("users", get_usage_version(), limit, cursor, sort, order, search),
+            cache_control=PRIVATE_REVALIDATE
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting users: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/admin/stats")
-async def get_stats(username: str = Depends(verify_token)):
+async def get_stats(request: Request, username: str = Depends(verify_token)):
     """
     Get total application statistics
     """
     try:
-        stats = get_total_app_stats()
-        return stats
+        return await cached_json(
+            request, get_total_app_stats,
+            etag=make_etag("stats", get_usage_version()),
+            cache_control=PRIVATE_REVALIDATE
+        )
     except Exception as e:
         print(f"Error getting stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/admin/usage-over-time")
-async def get_usage(username: str = Depends(verify_token)):
+async def get_usage(request: Request, username: str = Depends(verify_token)):
     """
     Get usage data over time for graphs
     """
     try:
-        usage_data = get_usage_over_time()
-        return {"usage": usage_data}
+        return await cached_json(
+            request, lambda: {"usage": get_usage_over_time()},
+            etag=make_etag("usage-over-time", get_usage_version()),
+            cache_control=PRIVATE_REVALIDATE
+        )
     except Exception as e:
         print(f"Error getting usage data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/admin/metrics")
+async def get_metrics(username: str = Depends(verify_token)):
+    """
+    Get cache, retrieval, single-flight, upstream, pipeline, memory, prompt, HTTP cache and write queue counters
+    """
+    try:
+        return {
+            "embedding_cache": embedding_cache.stats(),
+            "answer_cache": answer_cache.stats(),
+            "retrieval": get_retrieval_stats(),
+            "single_flight": get_single_flight_stats(),
+            "upstream": get_upstream_stats(),
+            "pipelines": get_pipeline_stats(),
+            "memory": get_memory_stats(),
+            "prompts": get_prompt_stats(),
+            "http_cache": get_http_cache_stats(),
+            "write_queue": dict(write_queue.stats)
+        }
+    except Exception as e:
+        print(f"Error getting metrics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Bytes read per upload piece when saving documents
+UPLOAD_READ_SIZE = 1024 * 1024
+
+@router.post("/api/admin/reindex", status_code=202)
+async def reindex_knowledge_base(username: str = Depends(verify_token)):
+    """
+    Start re-syncing embeddings with the knowledge base, embedding only changed chunks
+    """
+    try:
+        return start_reindex_job()
+    except Exception as e:
+        print(f"Error starting reindex: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/admin/documents", status_code=202)
+async def upload_documents(files: List[UploadFile] = File(...), username: str = Depends(verify_token)):
+    """
+    Add or replace knowledge-base documents and start ingesting them
+    """
+    for upload in files:
+        if Path(upload.filename or "").suffix.lower() not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type: {upload.filename} (allowed: {', '.join(sorted(SUPPORTED_EXTENSIONS))})"
+            )
+    
+    try:
+        DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
+        saved = []
+        for upload in files:
+            name = Path(upload.filename).name
+            tmp_path = DOCUMENTS_DIR / f".{name}.upload"
+            with open(tmp_path, "wb") as f:
+                while True:
+                    piece = await upload.read(UPLOAD_READ_SIZE)
+                    if not piece:
+                        break
+                    f.write(piece)
+            os.replace(tmp_path, DOCUMENTS_DIR / name)
+            saved.append(name)
+        
+        job = start_reindex_job()
+        job["documents_saved"] = saved
+        return job
+    except Exception as e:
+        print(f"Error uploading documents: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/admin/ingestion/{job_id}")
+async def get_ingestion_job(job_id: str, username: str = Depends(verify_token)):
+    """
+    Progress of a background ingestion job
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
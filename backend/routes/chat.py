@@ -1,23 +1,229 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models.conversation import ChatRequest, ChatResponse
-from services.rag_service import search_knowledge, get_conversation_context
-from services.llm_service import generate_response_with_tokens
+from services.rag_service import search_knowledge, get_conversation_context, get_knowledge_version, needs_query_embedding
+from services.llm_service import generate_prompt_with_tokens, stream_prompt_with_tokens, estimate_token_info
+from services.prompt_builder import pack_prompt
+from services.embedding_service import get_embedding
+from services.answer_cache import answer_cache, build_context_key
+from services.embedding_cache import normalize_text
+from services.single_flight import SingleFlight
+from services.upstream import generation_lane, UpstreamOverloaded
+from services.pipeline import Pipeline, Stage
+from services.memory import load_recent_messages, load_summary, unsummarized, needs_summary, schedule_summary
 from database.db import (
     get_setting, save_conversation_with_user, save_message,
-    get_conversation_history, save_token_usage, update_conversation_title
+    save_token_usage, update_conversation_title
 )
+from services.executor import run_in_pool, iterate_in_pool
 from routes.user import verify_user_token
+import json
+import os
 import uuid
 
 router = APIRouter()
 security = HTTPBearer()
 
+# Concurrent identical calls share one upstream request (see single_flight.py)
+embedding_flight = SingleFlight("embedding")
+retrieval_flight = SingleFlight("retrieval")
+llm_flight = SingleFlight("llm")
+
+# Per-stage timeouts of the pre-LLM pipeline, in seconds
+PIPELINE_DB_TIMEOUT = float(os.getenv("PIPELINE_DB_TIMEOUT", "5"))
+PIPELINE_EMBEDDING_TIMEOUT = float(os.getenv("PIPELINE_EMBEDDING_TIMEOUT", "15"))
+PIPELINE_RETRIEVAL_TIMEOUT = float(os.getenv("PIPELINE_RETRIEVAL_TIMEOUT", "15"))
+
+ESCALATION_MESSAGE = "I understand you're asking about refunds or money back. I'd be happy to connect you with our support team who can better assist you with this request. Would you like me to transfer you to a human agent?"
+
 def check_escalation(message: str) -> bool:
     """Check if message contains escalation keywords (refund/money back)"""
     keywords = ['refund', 'money back']
     return any(keyword in message.lower() for keyword in keywords)
 
+def log_escalation(user_id: int, conversation_id: str, message: str):
+    """Log an escalation in JSON format"""
+    import datetime
+    escalation_log = {
+        "needs_human": True,
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "message": message,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "reason": "refund_or_money_back_request"
+    }
+    print(f"ESCALATION LOG: {json.dumps(escalation_log, indent=2)}")
+
+def build_conversation_title(message: str) -> str:
+    """Create a smart title from the user's first message"""
+    title = message.strip()
+    # Remove question marks and clean up
+    title = title.replace('?', '').replace('!', '')
+    # Capitalize first letter
+    title = title[0].upper() + title[1:] if len(title) > 1 else title
+    # Limit length
+    if len(title) > 60:
+        # Try to cut at a word boundary
+        title = title[:60].rsplit(' ', 1)[0] + '...'
+    return title
+
+async def embed_message(message: str):
+    """Query embedding, shared between concurrent identical questions"""
+    embedding, _ = await embedding_flight.run(
+        normalize_text(message), lambda: run_in_pool("embedding", get_embedding, message)
+    )
+    return embedding
+
+async def load_history(state: dict) -> list:
+    """Recent conversation memory, ending with the message just saved"""
+    return await run_in_pool("db", load_recent_messages, state["conversation_id"])
+
+async def load_memory_summary(state: dict):
+    """Rolling summary of the conversation's older messages"""
+    return await run_in_pool("db", load_summary, state["conversation_id"])
+
+async def load_tone(state: dict) -> str:
+    return await run_in_pool("db", get_setting, "tone_instructions")
+
+async def embed_query(state: dict):
+    """Query embedding, or None for queries answered by keyword search alone"""
+    if not needs_query_embedding(state["message"]):
+        return None
+    return await embed_message(state["message"])
+
+async def retrieve(state: dict):
+    """
+    Relevant chunks and their similarity, reusing the query embedding
+
+    The embedding stage has already run (or timed out), so a missing
+    embedding means keyword search only: retrying the call here would wait
+    on the same slow upstream a second time.
+    """
+    message = state["message"]
+    retrieval_key = (normalize_text(message), 5, get_knowledge_version())
+    result, _ = await retrieval_flight.run(
+        retrieval_key,
+        lambda: run_in_pool("embedding", search_knowledge, message, top_k=5,
+                            query_embedding=state["query_embedding"], allow_embed=False)
+    )
+    return result
+
+async def lookup_cached_answer(state: dict):
+    """
+    Look for a cached answer to a near-duplicate question
+
+    Only first turns are eligible, since later turns depend on conversation
+    memory. Returns (cached_answer, cache_entry_key); cached_answer is None on
+    a miss and cache_entry_key is None when the turn is not cacheable.
+    """
+    if len(state["history"]) != 1:
+        return None, None
+
+    message = state["message"]
+    embedding = state["query_embedding"]
+    if embedding is None and not needs_query_embedding(message):
+        # Keyword queries skip the embedding stage, but the cache needs one
+        embedding = await embed_message(message)
+    if embedding is None:
+        return None, None
+
+    context_key = build_context_key(state["tone"], get_knowledge_version())
+    cached = answer_cache.lookup(embedding, context_key)
+    return (cached["answer"] if cached else None), (embedding, context_key)
+
+# Everything the LLM call needs, as concurrent stages: memory, settings and
+# the query embedding are independent; retrieval and the answer cache wait
+# only for what they use. Retrieval, the summary and the cache degrade
+# instead of failing.
+chat_pipeline = Pipeline("chat", [
+    Stage("history", load_history, timeout=PIPELINE_DB_TIMEOUT),
+    Stage("summary", load_memory_summary, timeout=PIPELINE_DB_TIMEOUT, fallback=None),
+    Stage("tone", load_tone, timeout=PIPELINE_DB_TIMEOUT),
+    Stage("query_embedding", embed_query, timeout=PIPELINE_EMBEDDING_TIMEOUT, fallback=None),
+    Stage("retrieval", retrieve, deps=["query_embedding"], timeout=PIPELINE_RETRIEVAL_TIMEOUT, fallback=([], 0.0)),
+    Stage("cached_answer", lookup_cached_answer, deps=["history", "tone", "query_embedding"],
+          timeout=PIPELINE_EMBEDDING_TIMEOUT, fallback=(None, None)),
+])
+
+def build_prompt_plan(message: str, state: dict) -> dict:
+    """Pack the pipeline results into a prompt within the token budget (see prompt_builder.py)"""
+    relevant_chunks, similarity_score = state["retrieval"]
+    conversation_memory = state["history"]
+
+    # Conversation memory: the summary of older messages, then the recent
+    # ones it does not cover yet (before the current message)
+    summary = state["summary"]
+    memory_lines = []
+    if summary:
+        memory_lines.append(f"(Summary of earlier messages: {summary['summary']})")
+    memory_lines.extend(f"{msg['role']}: {msg['content']}" for msg in unsummarized(conversation_memory[:-1], summary))
+
+    return pack_prompt(state["tone"], relevant_chunks, memory_lines, message)
+
+def store_cached_answer(cache_entry_key, message: str, ai_response: str, token_info: dict):
+    """Remember a successfully generated first-turn answer"""
+    if cache_entry_key and token_info:
+        embedding, context_key = cache_entry_key
+        answer_cache.store(embedding, context_key, message, ai_response)
+
+async def generate_reply(plan: dict):
+    """
+    Generate a reply, sharing one Gemini call between concurrent identical first turns
+
+    Returns (ai_response, token_info, shared). Only memory-free turns are
+    coalesced, keyed on the exact prompt; shared replies cost nothing and
+    are recorded like cache hits.
+    """
+    prompt = plan["prompt"]
+    if plan["memory_used"] or plan["memory_dropped"]:
+        ai_response, token_info = await run_in_pool("llm", generate_prompt_with_tokens, prompt)
+        return ai_response, token_info, False
+
+    (ai_response, token_info), shared = await llm_flight.run(
+        prompt, lambda: run_in_pool("llm", generate_prompt_with_tokens, prompt)
+    )
+    return ai_response, token_info, shared
+
+def finalize_turn(conversation_id: str, user_id: int, message: str, conversation_memory: list, ai_response: str, token_info: dict, cache_hit: bool = False, summary: dict = None):
+    """Persist token usage, title and the assistant reply once a turn has finished, and keep the summary up to date"""
+    # Save token usage; cache hits are recorded as zero-cost turns
+    if cache_hit:
+        save_token_usage(conversation_id, user_id, 0, 0, 0, 0.0, cache_hit=True)
+    elif token_info:
+        save_token_usage(
+            conversation_id,
+            user_id,
+            token_info["prompt_tokens"],
+            token_info["completion_tokens"],
+            token_info["total_tokens"],
+            token_info["cost"]
+        )
+
+    # Auto-generate title from first message
+    if len(conversation_memory) == 1:  # First message
+        update_conversation_title(conversation_id, build_conversation_title(message), user_id)
+
+    # Save assistant response
+    save_message(conversation_id, "assistant", ai_response, user_id)
+
+    # Fold messages that have left the memory window into the rolling summary
+    if needs_summary(conversation_memory, summary, added=1):
+        schedule_summary(conversation_id, user_id)
+
+def overloaded_error(e: UpstreamOverloaded) -> HTTPException:
+    """503 telling the client when to retry a request shed by the upstream scheduler"""
+    print(f"Shedding chat request: {e}")
+    return HTTPException(
+        status_code=503,
+        detail="The assistant is busy right now. Please try again shortly.",
+        headers={"Retry-After": e.retry_after_header}
+    )
+
+def format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, user_id: int = Depends(verify_user_token)):
     """
@@ -26,100 +232,154 @@ async def chat(request: ChatRequest, user_id: int = Depends(verify_user_token)):
     try:
         # Generate or use conversation ID
         conversation_id = request.conversation_id or str(uuid.uuid4())
-        
+
         # Save conversation if new
-        save_conversation_with_user(conversation_id, user_id)
-        
+        await run_in_pool("db", save_conversation_with_user, conversation_id, user_id)
+
         # Save user message
-        save_message(conversation_id, "user", request.message)
-        
+        await run_in_pool("db", save_message, conversation_id, "user", request.message, user_id)
+
         # Check for escalation keywords (refund/money back)
         if check_escalation(request.message):
-            # Log escalation in JSON format
-            import json
-            import datetime
-            escalation_log = {
-                "needs_human": True,
-                "user_id": user_id,
-                "conversation_id": conversation_id,
-                "message": request.message,
-                "timestamp": datetime.datetime.now().isoformat(),
-                "reason": "refund_or_money_back_request"
-            }
-            print(f"ESCALATION LOG: {json.dumps(escalation_log, indent=2)}")
-            
+            log_escalation(user_id, conversation_id, request.message)
+
             # Save assistant response with human handoff option
-            escalation_message = "I understand you're asking about refunds or money back. I'd be happy to connect you with our support team who can better assist you with this request. Would you like me to transfer you to a human agent?"
-            save_message(conversation_id, "assistant", escalation_message)
-            
+            await run_in_pool("db", save_message, conversation_id, "assistant", ESCALATION_MESSAGE, user_id)
+
             return ChatResponse(
-                reply=escalation_message,
+                reply=ESCALATION_MESSAGE,
                 needs_human=True,
                 conversation_id=conversation_id
             )
-        
-        # Get conversation history for context (memory)
-        conversation_memory = get_conversation_history(conversation_id)
-        
-        # Search for relevant context using RAG
-        relevant_chunks, similarity_score = search_knowledge(request.message, top_k=5)
-        
-        # Get settings from database
-        tone_instructions = get_setting("tone_instructions")
-        fallback_message = get_setting("fallback_message")
-        
-        # Build context from relevant chunks (use lower threshold)
-        context = "\n\n".join(relevant_chunks) if relevant_chunks else "No specific context available."
-        
-        # Add conversation memory (last 5 messages for context)
-        memory_context = ""
-        if len(conversation_memory) > 1:  # More than just the current message
-            recent_messages = conversation_memory[-6:-1]  # Last 5 messages before current
-            memory_context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in recent_messages])
-        
-        # Generate response using LLM with token tracking
-        ai_response, token_info = generate_response_with_tokens(
-            system_instructions=tone_instructions,
-            context=context,
-            user_message=request.message,
-            memory_context=memory_context
-        )
-        
-        # Save token usage
-        if token_info:
-            save_token_usage(
-                conversation_id,
-                user_id,
-                token_info["prompt_tokens"],
-                token_info["completion_tokens"],
-                token_info["total_tokens"],
-                token_info["cost"]
+
+        # Load memory and settings, embed, retrieve and check the answer cache concurrently
+        state = await chat_pipeline.run(conversation_id=conversation_id, message=request.message)
+        conversation_memory = state["history"]
+
+        # Serve near-duplicate first questions from the semantic answer cache
+        cached_answer, cache_entry_key = state["cached_answer"]
+        if cached_answer is not None:
+            await run_in_pool("db", finalize_turn, conversation_id, user_id, request.message, conversation_memory, cached_answer, None, cache_hit=True, summary=state["summary"])
+            return ChatResponse(
+                reply=cached_answer,
+                needs_human=False,
+                conversation_id=conversation_id
             )
-        
-        # Auto-generate title from first message
-        if len(conversation_memory) == 1:  # First message
-            # Create a smart title from the user's first message
-            title = request.message.strip()
-            # Remove question marks and clean up
-            title = title.replace('?', '').replace('!', '')
-            # Capitalize first letter
-            title = title[0].upper() + title[1:] if len(title) > 1 else title
-            # Limit length
-            if len(title) > 60:
-                # Try to cut at a word boundary
-                title = title[:60].rsplit(' ', 1)[0] + '...'
-            update_conversation_title(conversation_id, title)
-        
-        # Save assistant response
-        save_message(conversation_id, "assistant", ai_response)
-        
+
+        plan = build_prompt_plan(request.message, state)
+
+        # Generate response using LLM with token tracking
+        ai_response, token_info, shared = await generate_reply(plan)
+
+        if not shared:
+            store_cached_answer(cache_entry_key, request.message, ai_response, token_info)
+        await run_in_pool("db", finalize_turn, conversation_id, user_id, request.message, conversation_memory, ai_response, token_info, cache_hit=shared and token_info is not None, summary=state["summary"])
+
         return ChatResponse(
             reply=ai_response,
             needs_human=False,
             conversation_id=conversation_id
         )
-    
+
+    except UpstreamOverloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
-        error_msg = {"role": "assistant", "content": "Sorry, an error occurred. Please try again."}
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, user_id: int = Depends(verify_user_token)):
+    """
+    Streaming chat endpoint that sends the reply as Server-Sent Events
+
+    Events: "meta" (conversation_id), "token" (text), "done" (needs_human,
+    conversation_id) and "error" (detail, plus retry_after in seconds when
+    the request was shed under load). Returns 503 with Retry-After when the
+    generation queue is already full.
+    """
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+
+    try:
+        # Shed load before the stream starts, while a 503 can still be sent
+        generation_lane.check_admission()
+        await run_in_pool("db", save_conversation_with_user, conversation_id, user_id)
+        await run_in_pool("db", save_message, conversation_id, "user", request.message, user_id)
+    except UpstreamOverloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        print(f"Error in chat stream endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        yield format_sse("meta", {"conversation_id": conversation_id})
+
+        if check_escalation(request.message):
+            log_escalation(user_id, conversation_id, request.message)
+            await run_in_pool("db", save_message, conversation_id, "assistant", ESCALATION_MESSAGE, user_id)
+            yield format_sse("token", {"text": ESCALATION_MESSAGE})
+            yield format_sse("done", {"needs_human": True, "conversation_id": conversation_id})
+            return
+
+        parts = []
+        token_info = None
+        plan = None
+        llm_stream = None
+        conversation_memory = []
+        summary = None
+        cache_hit = False
+        cache_entry_key = None
+        try:
+            state = await chat_pipeline.run(conversation_id=conversation_id, message=request.message)
+            conversation_memory = state["history"]
+            summary = state["summary"]
+
+            cached_answer, cache_entry_key = state["cached_answer"]
+            if cached_answer is not None:
+                cache_hit = True
+                parts.append(cached_answer)
+                yield format_sse("token", {"text": cached_answer})
+                yield format_sse("done", {"needs_human": False, "conversation_id": conversation_id})
+                return
+
+            plan = build_prompt_plan(request.message, state)
+
+            llm_stream = stream_prompt_with_tokens(plan["prompt"])
+            async for text, info in iterate_in_pool("llm", llm_stream):
+                if info:
+                    token_info = info
+                if text:
+                    parts.append(text)
+                    yield format_sse("token", {"text": text})
+                if await http_request.is_disconnected():
+                    print(f"Client disconnected from stream {conversation_id}")
+                    break
+            else:
+                store_cached_answer(cache_entry_key, request.message, "".join(parts), token_info)
+                yield format_sse("done", {"needs_human": False, "conversation_id": conversation_id})
+        except UpstreamOverloaded as e:
+            print(f"Shedding chat stream {conversation_id}: {e}")
+            yield format_sse("error", {"detail": "The assistant is busy right now. Please try again shortly.", "retry_after": int(e.retry_after_header)})
+        except Exception as e:
+            print(f"Error in chat stream endpoint: {e}")
+            yield format_sse("error", {"detail": "Sorry, an error occurred. Please try again."})
+        finally:
+            if llm_stream is not None:
+                try:
+                    llm_stream.close()
+                except ValueError:
+                    # Generator is still running in the worker thread after a cancelled request
+                    pass
+            # Persist whatever was generated, including partial replies from
+            # clients that disconnected mid-stream. Gemini only reports usage
+            # at the end of the stream, but the prompt and the partial output
+            # were still billed, so record local estimates instead.
+            if parts and token_info is None and plan is not None and not cache_hit:
+                token_info = estimate_token_info(plan["prompt_tokens"], "".join(parts))
+            if parts:
+                await run_in_pool("db", finalize_turn, conversation_id, user_id, request.message, conversation_memory, "".join(parts), token_info, cache_hit=cache_hit, summary=summary)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
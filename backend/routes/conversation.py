@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from models.conversation import ConversationHistory, Message
 from database.db import get_conversation_history
+from services.executor import run_in_pool
 
 router = APIRouter()
 
@@ -10,7 +11,7 @@ async def get_conversation(conversation_id: str):
     Get conversation history by ID
     """
     try:
-        messages = get_conversation_history(conversation_id)
+        messages = await run_in_pool("db", get_conversation_history, conversation_id)
         
         if not messages:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from models.user import UserSignup, UserLogin, UserResponse, ConversationListItem
 from database.db import (
     create_user, verify_user_credentials, get_user_by_email,
-    get_user_conversations, get_conversation_messages
+    get_user_conversations, get_conversation_messages,
+    get_conversations_version, get_conversation_version
 )
+from services.http_cache import (
+    cached_json, make_etag, PRIVATE_REVALIDATE, HISTORY_PAGE_CACHE_CONTROL
+)
+from services.executor import run_in_pool
+from typing import Optional
 import os
 
 router = APIRouter()
@@ -17,6 +23,9 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 43200  # 30 days
 
+# Largest page served by the conversation and message listings
+PAGE_MAX = 200
+
 def create_access_token(data: dict):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -97,21 +106,62 @@ async def login(request: UserLogin):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/user/conversations")
-async def get_conversations(user_id: int = Depends(verify_user_token)):
-    """Get all conversations for the authenticated user"""
+async def get_conversations(
+    request: Request,
+    limit: int = Query(50, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(verify_user_token)
+):
+    """Get one page of the authenticated user's conversations, most recent first"""
     try:
-        conversations = get_user_conversations(user_id)
-        return {"conversations": conversations}
+        # Versions wait for the user's queued writes, so read them off the event loop
+        version = await run_in_pool("db", get_conversations_version, user_id)
+        return await cached_json(
+            request, lambda: get_user_conversations(user_id, limit, cursor),
+            etag=make_etag("conversations", user_id, version, limit, cursor),
+            cache_control=PRIVATE_REVALIDATE,
+            vary="Authorization"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting conversations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/user/conversations/{conversation_id}/messages")
-async def get_messages(conversation_id: str, user_id: int = Depends(verify_user_token)):
-    """Get all messages for a specific conversation"""
+async def get_messages(
+    request: Request,
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    since: Optional[int] = None,
+    user_id: int = Depends(verify_user_token)
+):
+    """Get the latest messages of a conversation, an older page (cursor) or the messages after one the client has (since)"""
+    if cursor and since is not None:
+        raise HTTPException(status_code=400, detail="Use either cursor or since, not both")
     try:
-        messages = get_conversation_messages(conversation_id)
-        return messages
+        def build():
+            return get_conversation_messages(conversation_id, limit, cursor, since)
+        
+        if cursor:
+            # Pages before a cursor never change (messages are only appended),
+            # so they are validated on the cursor alone
+            return await cached_json(
+                request, build,
+                etag=make_etag("messages", conversation_id, limit, cursor),
+                cache_control=HISTORY_PAGE_CACHE_CONTROL,
+                vary="Authorization"
+            )
+        version = await run_in_pool("db", get_conversation_version, conversation_id) or {}
+        return await cached_json(
+            request, build,
+            etag=make_etag("messages", conversation_id, version.get("last_message_at"), version.get("message_count"), limit, since),
+            cache_control=PRIVATE_REVALIDATE,
+            vary="Authorization"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting messages: {e}")
         raise HTTPException(status_code=500, detail=str(e))
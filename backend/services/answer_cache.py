@@ -0,0 +1,116 @@
+"""
+Semantic answer cache
+
+Stores past first-turn answers with the embedding of their question. A new
+question whose embedding is close enough (cosine similarity at or above
+ANSWER_CACHE_THRESHOLD) reuses the stored answer, skipping retrieval and
+the LLM call entirely.
+
+Every entry is tied to a context key built from the tone instructions and
+the knowledge-base version; when either changes the whole cache is
+dropped, so edited settings or a re-index never serve old answers.
+
+Configuration (environment variables):
+- ANSWER_CACHE_THRESHOLD: minimum cosine similarity for a hit (default 0.95)
+- ANSWER_CACHE_SIZE: maximum entries (default 1000)
+- ANSWER_CACHE_TTL: seconds an entry stays valid (default 1 day)
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+
+def build_context_key(tone_instructions: str, knowledge_version: str) -> str:
+    """Key that ties cached answers to the settings and knowledge base that produced them"""
+    raw = f"{tone_instructions or ''}\x00{knowledge_version or ''}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class SemanticAnswerCache:
+    """Ring buffer of (question embedding, answer) pairs searched by cosine similarity"""
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._context_key = None
+        self._vectors = None  # (max_entries, dim) float32, rows L2-normalized
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._entries = [None] * max_entries  # (question, answer)
+        self._size = 0
+        self._next = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def _reset(self, context_key: str):
+        self._context_key = context_key
+        self._vectors = None
+        self._stored_at[:] = 0
+        self._entries = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, context_key: str):
+        """Return {"question", "answer", "similarity"} for the best match, or None"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if context_key != self._context_key:
+                if self._context_key is not None:
+                    self._stats["invalidations"] += 1
+                self._reset(context_key)
+            if not self._size or self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = self._vectors[:self._size] @ query
+            expired = self._stored_at[:self._size] < time.time() - self.ttl
+            similarities[expired] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self._stats["misses"] += 1
+                return None
+
+            self._stats["hits"] += 1
+            question, answer = self._entries[best]
+            return {"question": question, "answer": answer, "similarity": similarity}
+
+    def store(self, embedding, context_key: str, question: str, answer: str):
+        """Remember an answer for a question, evicting the oldest entry when full"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if context_key != self._context_key:
+                self._reset(context_key)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._reset(context_key)
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+            slot = self._next
+            self._vectors[slot] = vector
+            self._stored_at[slot] = time.time()
+            self._entries[slot] = (question, answer)
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+            self._stats["stores"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+answer_cache = SemanticAnswerCache()
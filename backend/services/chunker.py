@@ -0,0 +1,143 @@
+"""
+Sentence-aware chunker
+
+Splits streamed text into chunks sized by an estimated token budget,
+in a single pass:
+- Each chunk ends at the last paragraph break in its window, else the last
+  sentence end, else the last space (a hard cut only for unbroken text)
+- Consecutive chunks overlap by whole sentences only, and never across a
+  paragraph break, so no chunk is a near-copy of its neighbour
+- Every chunk is a record with its exact character offsets (text ==
+  document[start:end]), estimated tokens and a content hash
+
+Only the current window of text is held in memory, so documents of any size
+can be chunked from a block iterator (see documents.iter_document_text).
+
+Configuration (environment variables):
+- CHUNK_TOKENS: token budget per chunk (default 100, about 400 characters)
+- CHUNK_OVERLAP_TOKENS: maximum sentence overlap between chunks (default 20)
+"""
+
+from hashlib import sha256
+import os
+import re
+from typing import Iterable, Iterator
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "100"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "20"))
+
+# Average characters per token for English text with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+
+# A chunk is cut at a boundary only if it is at least this full
+MIN_FILL = 0.5
+
+_NON_SPACE = re.compile(r"\S")
+# Start of a sentence: whitespace after sentence-ending punctuation or a line break
+_SENTENCE_START = re.compile(r"(?:(?<=[.!?])\s+|\n\s*)(?=\S)")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, without calling a tokenizer (inlined in iter_chunks)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _last_sentence_end(buffer: str, low: int, high: int) -> int:
+    """Index just past the last '.', '?' or '!' in buffer[low:high] followed by whitespace, or -1"""
+    best = -1
+    for mark in ".?!":
+        i = buffer.rfind(mark, max(low, best), high)
+        # "v2.1" or "e.g.x" do not end a sentence
+        while i != -1 and not buffer[i + 1].isspace():
+            i = buffer.rfind(mark, max(low, best), i)
+        if i != -1:
+            best = i + 1
+    return best
+
+def _find_cut(buffer: str, low: int, high: int) -> int:
+    """Best end for a chunk in buffer[:high], at or after low"""
+    paragraph = buffer.rfind("\n\n", low, high)
+    if paragraph != -1:
+        return paragraph
+    sentence = _last_sentence_end(buffer, low, high)
+    if sentence != -1:
+        return sentence
+    line = buffer.rfind("\n", low, high)
+    if line != -1:
+        return line
+    space = buffer.rfind(" ", low, high)
+    if space != -1:
+        return space
+    return high
+
+def iter_chunks(blocks: Iterable[str], max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[dict]:
+    """
+    Chunk streamed text
+
+    Args:
+        blocks: Text pieces, in order
+        max_tokens: Token budget per chunk
+        overlap_tokens: Maximum tokens of whole sentences repeated from the previous chunk
+
+    Yields:
+        {"text", "start", "end", "tokens", "hash"} with offsets into the full text
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    min_chars = int(max_chars * MIN_FILL)
+    # Overlap stays below the minimum fill, so the next chunk always ends further along
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max(0, min_chars - 1))
+
+    blocks = iter(blocks)
+    buffer = ""
+    offset = 0  # Position of buffer[0] in the full text
+    exhausted = False
+    position = 0  # Start of the next chunk
+
+    while True:
+        # Buffer a full window plus one character (or up to the end of the text)
+        while not exhausted and offset + len(buffer) <= position + max_chars:
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                buffer += block
+
+        # Chunks start on non-whitespace
+        match = _NON_SPACE.search(buffer, position - offset)
+        if match is None:
+            if exhausted:
+                break
+            position = offset + len(buffer)
+            continue
+        local = match.start()
+        window_end = local + max_chars
+        if window_end >= len(buffer) and not exhausted:
+            # Skipped whitespace moved the window past the buffered text
+            position = offset + local
+            continue
+
+        final = exhausted and window_end >= len(buffer)
+        cut = len(buffer) if final else _find_cut(buffer, local + min_chars, window_end)
+        text = buffer[local:cut].rstrip()
+        start = offset + local
+        length = len(text)
+        yield {
+            "text": text,
+            "start": start,
+            "end": start + length,
+            "tokens": (length + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+            "hash": sha256(text.encode("utf-8")).hexdigest()
+        }
+        if final:
+            break
+
+        # Overlap with the last whole sentences, unless the chunk ended a paragraph
+        next_local = cut
+        if overlap_chars and not buffer.startswith("\n\n", cut):
+            sentence = _SENTENCE_START.search(buffer, max(local + 1, cut - overlap_chars), cut)
+            if sentence is not None:
+                next_local = sentence.end()
+        position = offset + next_local
+
+        # Drop text that no later chunk can reach
+        if next_local > len(buffer) // 2:
+            buffer = buffer[next_local:]
+            offset += next_local
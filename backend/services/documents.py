@@ -0,0 +1,99 @@
+"""
+Knowledge-base documents
+
+The knowledge base is data/article.txt plus every supported file under
+data/documents/ (plain text, Markdown and HTML). Documents are read
+incrementally in blocks so large files never have to fit in one string;
+HTML is converted to text on the fly, dropping tags, scripts and styles.
+
+Configuration (environment variables):
+- DOCUMENTS_DIR: directory scanned for documents (default data/documents)
+"""
+
+import os
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Iterator, List
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+ARTICLE_PATH = DATA_DIR / "article.txt"
+DOCUMENTS_DIR = Path(os.getenv("DOCUMENTS_DIR", str(DATA_DIR / "documents")))
+
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".markdown", ".html", ".htm"}
+
+# Characters read per block
+READ_BLOCK_SIZE = 16 * 1024
+
+# Tags that end a line of text, so the chunker can break on them
+_BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "pre", "blockquote"}
+_SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+class _HTMLTextExtractor(HTMLParser):
+    """Incremental HTML to text converter; collected text is drained after each feed()"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+    def drain(self) -> str:
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+def list_documents() -> List[Path]:
+    """All knowledge-base documents, in a stable order"""
+    paths = [ARTICLE_PATH] if ARTICLE_PATH.exists() else []
+    if DOCUMENTS_DIR.exists():
+        paths.extend(sorted(
+            path for path in DOCUMENTS_DIR.rglob("*")
+            if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+        ))
+    return paths
+
+def document_source(path: Path) -> str:
+    """Source label stored with each chunk (path relative to the data directory)"""
+    try:
+        return path.relative_to(DATA_DIR).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+def iter_document_text(path: Path) -> Iterator[str]:
+    """Yield the text of a document block by block"""
+    is_html = path.suffix.lower() in (".html", ".htm")
+    parser = _HTMLTextExtractor() if is_html else None
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            if parser is None:
+                yield block
+                continue
+            parser.feed(block)
+            text = parser.drain()
+            if text:
+                yield text
+
+    if parser is not None:
+        parser.close()
+        text = parser.drain()
+        if text:
+            yield text
@@ -0,0 +1,188 @@
+"""
+Two-tier cache for embeddings
+
+- Memory tier: bounded LRU, checked first
+- Disk tier: SQLite file that survives restarts (data/embedding_cache.db)
+
+Entries are keyed on the normalized text (lowercased, whitespace
+collapsed), the embedding model and the task type, and expire after a TTL.
+Both tiers are size-bounded; the disk tier is pruned oldest-used first.
+
+Configuration (environment variables):
+- EMBEDDING_CACHE_SIZE: memory tier entries (default 1024)
+- EMBEDDING_CACHE_DISK_SIZE: disk tier entries (default 100000)
+- EMBEDDING_CACHE_TTL: seconds an entry stays valid (default 7 days)
+- EMBEDDING_CACHE_PATH: disk tier location
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_PATH = Path(os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(__file__).parent.parent / "data" / "embedding_cache.db")
+))
+
+# Prune the disk tier every this many writes
+_PRUNE_EVERY = 256
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache lookups"""
+    return " ".join(text.lower().split())
+
+def cache_key(text: str, model: str, task_type: str) -> str:
+    raw = f"{model}\x00{task_type}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Bounded in-memory LRU backed by a persistent SQLite tier"""
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, disk_path: Path = EMBEDDING_CACHE_PATH,
+                 disk_max_entries: int = EMBEDDING_CACHE_DISK_SIZE, ttl: float = EMBEDDING_CACHE_TTL):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (embedding, stored_at)
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0, "disk_evictions": 0}
+
+    def _disk_connection(self) -> sqlite3.Connection:
+        if self._disk is None:
+            self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.disk_path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    embedding BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used)")
+            conn.commit()
+            self._disk = conn
+        return self._disk
+
+    def get(self, text: str, model: str, task_type: str):
+        """Return the cached embedding, or None on a miss"""
+        key = cache_key(text, model, task_type)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                embedding, stored_at = entry
+                if now - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return embedding
+                del self._memory[key]
+
+        embedding, stored_at = self._disk_get(key, now)
+        if embedding is not None:
+            self._memory_put(key, embedding, stored_at)
+            with self._lock:
+                self._stats["disk_hits"] += 1
+            return embedding
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, text: str, model: str, task_type: str, embedding: list):
+        """Store an embedding in both tiers"""
+        key = cache_key(text, model, task_type)
+        now = time.time()
+        self._memory_put(key, embedding, now)
+        self._disk_put(key, embedding, now)
+
+    def _memory_put(self, key: str, embedding: list, stored_at: float):
+        with self._lock:
+            self._memory[key] = (embedding, stored_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats["memory_evictions"] += 1
+
+    def _disk_get(self, key: str, now: float):
+        try:
+            with self._disk_lock:
+                conn = self._disk_connection()
+                row = conn.execute(
+                    "SELECT embedding, created_at FROM embedding_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None, None
+                if now - row[1] >= self.ttl:
+                    conn.execute("DELETE FROM embedding_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None, None
+                conn.execute("UPDATE embedding_cache SET last_used = ? WHERE key = ?", (now, key))
+                conn.commit()
+            return array("f", row[0]).tolist(), row[1]
+        except sqlite3.Error as e:
+            print(f"Error reading embedding cache: {e}")
+            return None, None
+
+    def _disk_put(self, key: str, embedding: list, now: float):
+        try:
+            with self._disk_lock:
+                conn = self._disk_connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO embedding_cache (key, embedding, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, array("f", embedding).tobytes(), now, now)
+                )
+                conn.commit()
+                self._disk_writes += 1
+                if self._disk_writes % _PRUNE_EVERY == 0:
+                    self._prune_disk(conn, now)
+        except sqlite3.Error as e:
+            print(f"Error writing embedding cache: {e}")
+
+    def _prune_disk(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used beyond the size limit"""
+        expired = conn.execute("DELETE FROM embedding_cache WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        overflow = max(0, count - self.disk_max_entries)
+        if overflow:
+            conn.execute("""
+                DELETE FROM embedding_cache WHERE key IN (
+                    SELECT key FROM embedding_cache ORDER BY last_used ASC LIMIT ?
+                )
+            """, (overflow,))
+        conn.commit()
+        with self._lock:
+            self._stats["disk_evictions"] += expired + overflow
+
+    def stats(self) -> dict:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Empty both tiers"""
+        with self._lock:
+            self._memory.clear()
+        with self._disk_lock:
+            conn = self._disk_connection()
+            conn.execute("DELETE FROM embedding_cache")
+            conn.commit()
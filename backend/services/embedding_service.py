@@ -1,20 +1,145 @@
+"""
+Embedding providers
+
+- gemini: Google Gemini embedding-001 (remote, 768 dimensions)
+- local: hashed word and character n-gram features projected to a fixed
+  dimension on the CPU. It needs no network or training, so query
+  embedding takes well under a millisecond and the same text always maps
+  to the same vector.
+
+The provider is chosen per deployment. Vectors from different providers are
+not comparable, so every collection records the embedder that built it
+(see rag_service.open_vector_store) and is rebuilt when the provider changes.
+
+Configuration (environment variables):
+- EMBEDDING_PROVIDER: "gemini" (default) or "local"
+- LOCAL_EMBEDDING_DIM: dimension of the local embedder (default 512)
+"""
+
 import os
+import zlib
+import numpy as np
 import google.generativeai as genai
 from dotenv import load_dotenv
+from .embedding_cache import EmbeddingCache
+from .lexical_index import tokenize
+from .chunker import estimate_tokens
+from .upstream import embedding_lane, BACKGROUND, REQUEST_OPTIONS
 
 load_dotenv()
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-def get_embedding(text: str) -> list:
-    """Generate embedding for given text using Google Gemini"""
-    try:
-        result = genai.embed_content(
-            model="models/embedding-001",
-            content=text,
-            task_type="retrieval_document"
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "512"))
+
+# Repeated questions skip the Gemini round trip (see embedding_cache.py)
+embedding_cache = EmbeddingCache()
+
+class GeminiEmbedder:
+    """Remote embeddings from Google Gemini, within the embedding lane's limits (see upstream.py)"""
+
+    remote = True
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        # The model name doubles as the embedder name, so cache keys and
+        # collections built before providers existed stay valid
+        self.name = model
+
+    def embed_one(self, text: str, task_type: str = "retrieval_document") -> list:
+        result = embedding_lane.call(
+            genai.embed_content, model=self.name, content=text, task_type=task_type,
+            request_options=REQUEST_OPTIONS, cost=estimate_tokens(text)
+        )
+        return result['embedding']
+
+    def embed(self, texts: list, task_type: str = "retrieval_document") -> list:
+        # Ingestion batches queue behind query embeddings and wait as long as it takes
+        result = embedding_lane.call(
+            genai.embed_content, model=self.name, content=texts, task_type=task_type,
+            request_options=REQUEST_OPTIONS, cost=sum(estimate_tokens(text) for text in texts),
+            priority=BACKGROUND, max_wait=None
         )
         return result['embedding']
+
+class LocalHashEmbedder:
+    """Signed feature hashing of words, word bigrams and character trigrams"""
+
+    remote = False
+
+    # Feature weights: whole words carry the most signal, trigrams add typo and inflection tolerance
+    WORD_WEIGHT = 1.0
+    BIGRAM_WEIGHT = 0.5
+    TRIGRAM_WEIGHT = 0.25
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"local-hash-v1/{dim}"
+
+    def _features(self, text: str):
+        words = tokenize(text)
+        for word in words:
+            yield word, self.WORD_WEIGHT
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], self.TRIGRAM_WEIGHT
+        for first, second in zip(words, words[1:]):
+            yield first + " " + second, self.BIGRAM_WEIGHT
+
+    def embed_one(self, text: str, task_type: str = "retrieval_document") -> list:
+        buckets = []
+        weights = []
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            buckets.append(h % self.dim)
+            weights.append(weight if h & 0x80000000 else -weight)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if buckets:
+            np.add.at(vector, buckets, weights)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed(self, texts: list, task_type: str = "retrieval_document") -> list:
+        return [self.embed_one(text) for text in texts]
+
+def create_embedder(provider: str):
+    if provider == "gemini":
+        return GeminiEmbedder()
+    if provider == "local":
+        return LocalHashEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider} (expected 'gemini' or 'local')")
+
+embedder = create_embedder(EMBEDDING_PROVIDER)
+
+def get_embedder_name() -> str:
+    """Name of the active embedder, recorded with every collection it builds"""
+    return embedder.name
+
+def get_embedding(text: str, task_type: str = "retrieval_document", use_cache: bool = True) -> list:
+    """Generate embedding for given text with the configured provider"""
+    current = embedder
+    # Local embeddings are cheaper to recompute than to look up
+    use_cache = use_cache and current.remote
+    if use_cache:
+        cached = embedding_cache.get(text, current.name, task_type)
+        if cached is not None:
+            return cached
+
+    try:
+        embedding = current.embed_one(text, task_type)
     except Exception as e:
         print(f"Error generating embedding: {e}")
         return None
+
+    if use_cache:
+        embedding_cache.put(text, current.name, task_type, embedding)
+    return embedding
+
+def get_embeddings(texts: list, task_type: str = "retrieval_document") -> list:
+    """Generate embeddings for a batch of texts in a single request (None on failure)"""
+    try:
+        return embedder.embed(texts, task_type)
+    except Exception as e:
+        print(f"Error generating batch of {len(texts)} embeddings: {e}")
+        return None
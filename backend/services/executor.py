@@ -0,0 +1,66 @@
+"""
+Bounded thread pools for blocking work
+
+The chat pipeline runs on the event loop, but SQLite, ChromaDB and the
+Gemini SDK are all blocking. Each kind of work is offloaded to its own
+bounded pool so a slow upstream call only ties up a worker thread, never
+the event loop, and a burst of one kind of work cannot starve the others.
+
+Pool sizes are configured with environment variables:
+- DB_POOL_SIZE: SQLite reads and writes (default 8)
+- EMBEDDING_POOL_SIZE: query embeddings and vector search (default 32)
+- LLM_POOL_SIZE: Gemini generation calls (default 256)
+- BACKGROUND_POOL_SIZE: background jobs such as conversation summaries (default 2)
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POOL_SIZES = {
+    "db": int(os.getenv("DB_POOL_SIZE", "8")),
+    "embedding": int(os.getenv("EMBEDDING_POOL_SIZE", "32")),
+    "llm": int(os.getenv("LLM_POOL_SIZE", "256")),
+    "background": int(os.getenv("BACKGROUND_POOL_SIZE", "2")),
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+_STREAM_END = object()
+
+def get_pool(name: str) -> ThreadPoolExecutor:
+    """Get (or lazily create) the named thread pool"""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ThreadPoolExecutor(
+                    max_workers=POOL_SIZES[name],
+                    thread_name_prefix=f"{name}-pool"
+                )
+                _pools[name] = pool
+    return pool
+
+async def run_in_pool(name: str, func, *args, **kwargs):
+    """Run a blocking function in the named pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(name), functools.partial(func, *args, **kwargs))
+
+async def iterate_in_pool(name: str, iterator):
+    """Consume a blocking iterator from the named pool, yielding items asynchronously"""
+    while True:
+        item = await run_in_pool(name, next, iterator, _STREAM_END)
+        if item is _STREAM_END:
+            break
+        yield item
+
+def shutdown_pools():
+    """Shut down all pools, waiting for running work to finish"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=True)
+        _pools.clear()
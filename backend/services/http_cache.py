@@ -0,0 +1,182 @@
+"""
+HTTP caching and compression for read endpoints
+
+Read endpoints answer with validators derived from cheap data versions
+rather than from the response body:
+- /api/admin/settings: the settings_version counter in app_meta
+- Conversation lists and message history: the conversations' last_message_at
+  and message_count columns
+- Admin analytics: the usage_totals rollup counters
+
+The version is read first (one indexed row). If it matches the client's
+If-None-Match, the endpoint answers 304 without running its queries or
+serializing anything. No Last-Modified is sent: HTTP dates have one-second
+resolution and messages can land several times a second, so
+If-Modified-Since could answer 304 for a copy that is out of date.
+Otherwise the body is built and serialized with orjson when it is
+installed, which is several times faster than the standard library on large
+lists.
+
+CompressionMiddleware compresses complete responses above
+COMPRESSION_MIN_SIZE bytes, with brotli when the client accepts it and the
+brotli package is installed, and with gzip otherwise. Streaming responses
+(the chat SSE stream) pass through untouched, so tokens are not held back in
+a compressor buffer.
+
+Configuration (environment variables):
+- HTTP_CACHE_SETTINGS_MAX_AGE: seconds clients may reuse the settings
+  without revalidating (default 60)
+- HTTP_CACHE_HISTORY_MAX_AGE: seconds clients may reuse an older page of
+  message history, which never changes (default 3600)
+- COMPRESSION_MIN_SIZE: smallest body compressed, in bytes (default 1000)
+- COMPRESSION_GZIP_LEVEL: gzip level (default 6)
+- COMPRESSION_BROTLI_QUALITY: brotli quality (default 4)
+"""
+
+import gzip
+import hashlib
+import os
+from typing import Any, Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+from .executor import run_in_pool
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    orjson = None
+    FastJSONResponse = JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTTP_CACHE_SETTINGS_MAX_AGE = int(os.getenv("HTTP_CACHE_SETTINGS_MAX_AGE", "60"))
+HTTP_CACHE_HISTORY_MAX_AGE = int(os.getenv("HTTP_CACHE_HISTORY_MAX_AGE", "3600"))
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Cache-Control policies
+SETTINGS_CACHE_CONTROL = f"public, max-age={HTTP_CACHE_SETTINGS_MAX_AGE}, must-revalidate"
+PRIVATE_REVALIDATE = "private, no-cache"
+HISTORY_PAGE_CACHE_CONTROL = f"private, max-age={HTTP_CACHE_HISTORY_MAX_AGE}"
+
+stats = {"responses": 0, "not_modified": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+def make_etag(*parts) -> str:
+    """Weak ETag from the data version and request parameters a response depends on"""
+    digest = hashlib.sha1("\x00".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" match
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's cached copy is current"""
+    if_none_match = request.headers.get("if-none-match")
+    return if_none_match is not None and _etag_matches(if_none_match, etag)
+
+async def cached_json(request: Request, build: Callable[[], Any], *, etag: str, cache_control: str,
+                      vary: Optional[str] = None) -> Response:
+    """
+    JSON response with validators, or 304 if the client already has it
+
+    build() is only called when the body is needed, in the db pool; the
+    validators must come from a version read before it.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+
+    stats["responses"] += 1
+    if is_not_modified(request, etag):
+        stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(await run_in_pool("db", build), headers=headers)
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts: br (if available), then gzip"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """Compress complete responses above a size threshold; streams pass through"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            initial, start = start, None
+            passthrough = True
+            headers = MutableHeaders(raw=initial["headers"])
+            body = message.get("body", b"")
+            if message.get("more_body", False) or "content-encoding" in headers or len(body) < self.minimum_size:
+                await send(initial)
+                await send(message)
+                return
+
+            compressed = _compress(body, encoding)
+            stats["compressed"] += 1
+            stats["bytes_in"] += len(body)
+            stats["bytes_out"] += len(compressed)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(initial)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+def get_http_cache_stats() -> dict:
+    return {
+        **stats,
+        "json_serializer": "orjson" if orjson is not None else "json",
+        "brotli": brotli is not None,
+        "compression_ratio": round(stats["bytes_out"] / stats["bytes_in"], 3) if stats["bytes_in"] else None
+    }
@@ -0,0 +1,261 @@
+"""
+Embedding ingestion pipeline
+
+Syncs a ChromaDB collection with a stream of content-addressed chunks:
+- Chunks are consumed lazily and embedded in batches (one Gemini request
+  per batch), holding at most INGEST_BATCH_SIZE * INGEST_WORKERS in memory
+- Batches run on a bounded worker pool
+- Each finished batch is written with a single bulk collection.add()
+- A manifest next to the collection records the chunk ids, whether the
+  build completed and which chunks failed to embed; the next sync reads it
+  to report an interrupted build and how many failed chunks it retried
+- Syncs can run as background jobs whose progress is polled by id
+
+Chunks already present in the collection are never re-embedded and chunks
+that disappeared are deleted, so an edit costs time proportional to what
+changed, and a sync interrupted by a crash or by failed batches resumes
+where it stopped instead of serving a half-built collection as complete.
+
+Configuration (environment variables):
+- INGEST_BATCH_SIZE: chunks per embedding request (default 64, Gemini allows 100)
+- INGEST_WORKERS: concurrent embedding requests (default 4)
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from .embedding_service import get_embeddings
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+
+def load_manifest(path: Path) -> dict:
+    """Load a sync manifest, or None if there is none"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_manifest(path: Path, manifest: dict):
+    """Write the manifest atomically so a crash never leaves it half-written"""
+    manifest["updated_at"] = time.time()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def get_existing_metadata(collection) -> dict:
+    """Ids already stored in the collection, mapped to their metadata"""
+    stored = collection.get(include=["metadatas"])
+    return {chunk_id: metadata or {} for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])}
+
+def embed_and_store(collection, ids: List[str], documents: List[str], metadatas: List[dict] = None,
+                    batch_size: int = INGEST_BATCH_SIZE, workers: int = INGEST_WORKERS, on_progress=None) -> dict:
+    """
+    Embed documents in concurrent batches and bulk-add them to the collection
+
+    Returns {"embedded": n, "failed_ids": [...]}. Failed batches are left out
+    of the collection so a later run can retry them.
+    """
+    batches = []
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        batches.append((ids[start:end], documents[start:end], metadatas[start:end] if metadatas else None))
+
+    embedded = 0
+    failed_ids = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest") as pool:
+        futures = {pool.submit(get_embeddings, batch_documents): (batch_ids, batch_documents, batch_metadatas)
+                   for batch_ids, batch_documents, batch_metadatas in batches}
+        # Writes stay on this thread; only the embedding requests run concurrently
+        for future in as_completed(futures):
+            batch_ids, batch_documents, batch_metadatas = futures[future]
+            embeddings = future.result()
+            if not embeddings or len(embeddings) != len(batch_ids):
+                failed_ids.extend(batch_ids)
+                continue
+            add_kwargs = {"ids": batch_ids, "embeddings": embeddings, "documents": batch_documents}
+            if batch_metadatas:
+                add_kwargs["metadatas"] = batch_metadatas
+            collection.add(**add_kwargs)
+            embedded += len(batch_ids)
+            if on_progress:
+                on_progress(embedded, len(ids))
+
+    return {"embedded": embedded, "failed_ids": failed_ids}
+
+def sync_collection(collection, records: Iterable[Tuple[str, str, dict]], manifest_path: Path, progress: dict = None,
+                    embedder_name: str = None) -> dict:
+    """
+    Bring the collection in line with a stream of (id, document, metadata) records
+
+    Ids are content-addressed, so the diff against what is stored is exact:
+    new ids are embedded, ids no longer present are deleted and everything
+    else is kept (only its metadata is refreshed if offsets moved). Records
+    are consumed lazily and embedded in bounded batches, so memory does not
+    grow with the size of the knowledge base. Interrupted or partially
+    failed syncs resume on the next call.
+
+    Returns {"documents", "chunks", "added", "removed", "unchanged", "failed",
+    "retried", "resumed"}: retried counts chunks that failed in the previous
+    sync and were embedded this time, resumed is True if the previous sync
+    was interrupted. Counts are also written to `progress` as they change,
+    for polling.
+    """
+    summary = progress if progress is not None else {}
+    summary.update({"documents": 0, "chunks": 0, "added": 0, "removed": 0, "unchanged": 0, "failed": 0,
+                    "retried": 0, "resumed": False})
+
+    # The previous sync's manifest only applies to vectors from the same embedder
+    previous = load_manifest(manifest_path)
+    if previous and previous.get("embedder") != embedder_name:
+        previous = None
+    previous_failed = set(previous.get("failed_ids", [])) if previous else set()
+    if previous and previous.get("status") == "in_progress":
+        summary["resumed"] = True
+        print(f"↻ Previous sync of {collection.name} did not finish; resuming (stored chunks are kept)")
+    if previous_failed:
+        print(f"↻ Retrying {len(previous_failed)} chunks that failed to embed in the previous sync")
+
+    existing = get_existing_metadata(collection)
+    manifest = {"collection": collection.name, "embedder": embedder_name, "status": "in_progress", "failed_ids": []}
+    save_manifest(manifest_path, manifest)
+
+    seen = set()
+    sources = set()
+    pending = []
+    updates = []
+    flush_size = INGEST_BATCH_SIZE * max(1, INGEST_WORKERS)
+
+    def flush_pending():
+        if not pending:
+            return
+        result = embed_and_store(collection, [r[0] for r in pending], [r[1] for r in pending], [r[2] for r in pending])
+        manifest["failed_ids"].extend(result["failed_ids"])
+        summary["added"] += result["embedded"]
+        summary["failed"] += len(result["failed_ids"])
+        if previous_failed:
+            failed_now = set(result["failed_ids"])
+            summary["retried"] += sum(1 for r in pending if r[0] in previous_failed and r[0] not in failed_now)
+        print(f"   Embedded {summary['added']} new chunks so far...")
+        pending.clear()
+
+    def flush_updates():
+        if updates:
+            collection.update(ids=[u[0] for u in updates], metadatas=[u[1] for u in updates])
+            updates.clear()
+
+    for chunk_id, document, metadata in records:
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        summary["chunks"] += 1
+        if metadata.get("source") not in sources:
+            sources.add(metadata.get("source"))
+            summary["documents"] = len(sources)
+
+        if chunk_id in existing:
+            summary["unchanged"] += 1
+            if existing[chunk_id] != metadata:
+                updates.append((chunk_id, metadata))
+                if len(updates) >= INGEST_BATCH_SIZE:
+                    flush_updates()
+            continue
+
+        pending.append((chunk_id, document, metadata))
+        if len(pending) >= flush_size:
+            flush_pending()
+
+    flush_pending()
+    flush_updates()
+
+    stale = sorted(set(existing) - seen)
+    if stale:
+        print(f"🗑️ Removing {len(stale)} chunks that are no longer in the knowledge base")
+        for start in range(0, len(stale), INGEST_BATCH_SIZE):
+            collection.delete(ids=stale[start:start + INGEST_BATCH_SIZE])
+        summary["removed"] = len(stale)
+
+    if manifest["failed_ids"]:
+        manifest["status"] = "partial"
+        print(f"⚠️ {len(manifest['failed_ids'])} chunks failed to embed; they will be retried on the next sync")
+    else:
+        manifest["status"] = "complete"
+        print(f"✅ Knowledge base in sync: {len(seen)} embeddings from {len(sources)} documents in persistent storage: {manifest_path.parent}")
+    manifest["chunk_ids"] = sorted(seen)
+    save_manifest(manifest_path, manifest)
+
+    return summary
+
+# Background ingestion jobs, polled through the admin API
+_jobs = {}
+_jobs_lock = threading.Lock()
+_MAX_FINISHED_JOBS = 20
+# Queued (job, target) started when the running job finishes
+_follow_up = None
+
+def start_job(target) -> dict:
+    """
+    Run target(progress) on a background thread and return the job
+
+    One job runs at a time. A request made while one is running gets a new
+    queued job that starts when the running one finishes, since the running
+    job may have listed the documents before the request changed them.
+    Requests made while a job is queued share it: it has not read anything
+    yet, so it covers them all.
+    """
+    global _follow_up
+    with _jobs_lock:
+        running = False
+        for job in _jobs.values():
+            if job["status"] == "queued":
+                return dict(job)
+            running = running or job["status"] == "running"
+
+        finished = [job_id for job_id, job in _jobs.items() if job["status"] not in ("queued", "running")]
+        for job_id in finished[:max(0, len(finished) - _MAX_FINISHED_JOBS + 1)]:
+            del _jobs[job_id]
+
+        job = {"id": uuid.uuid4().hex, "status": "queued", "started_at": time.time(), "finished_at": None, "error": None}
+        _jobs[job["id"]] = job
+        if running:
+            _follow_up = (job, target)
+            return dict(job)
+
+    _launch(job, target)
+    return dict(job)
+
+def _launch(job: dict, target):
+    def run():
+        global _follow_up
+        job["started_at"] = time.time()
+        job["status"] = "running"
+        try:
+            target(job)
+            job["status"] = "complete" if not job.get("failed") else "partial"
+        except Exception as e:
+            print(f"Error in ingestion job {job['id']}: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            with _jobs_lock:
+                follow_up, _follow_up = _follow_up, None
+            if follow_up:
+                _launch(*follow_up)
+
+    threading.Thread(target=run, name=f"ingest-job-{job['id'][:8]}", daemon=True).start()
+
+def get_job(job_id: str) -> dict:
+    """Current state of a job, or None if unknown"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
@@ -0,0 +1,71 @@
+"""
+Local BM25 lexical index
+
+An in-memory inverted index over the knowledge-base chunks, rebuilt next to
+the vector collection on every sync. It catches exact terms that
+embeddings blur (app names, error codes, device model numbers) and keeps
+retrieval working when no query embedding is available.
+
+Tokens are lowercased alphanumeric runs; dots, dashes and underscores
+inside a token are kept, so "err-404", "v2.1" and "mag_254" stay whole.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import List, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents"""
+
+    def __init__(self, ids: List[str], documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)  # term -> [(document index, term frequency)]
+        self._lengths = []
+
+        for index, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            self._lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self._postings[term].append((index, frequency))
+
+        total = len(self.documents)
+        self._average_length = (sum(self._lengths) / total) if total else 0.0
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def has_term(self, term: str) -> bool:
+        return term in self._postings
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Best (document index, score) pairs, highest score first; only documents sharing a term"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._lengths[index] / self._average_length
+                scores[index] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists; each list contributes 1 / (k + rank) per id"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
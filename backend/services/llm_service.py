@@ -1,6 +1,8 @@
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
+from .chunker import estimate_tokens
+from .upstream import generation_lane, UpstreamOverloaded, BACKGROUND, REQUEST_OPTIONS
 
 load_dotenv()
 
@@ -11,71 +13,187 @@ genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 GEMINI_INPUT_COST = 0.075 / 1_000_000  # $0.075 per 1M input tokens
 GEMINI_OUTPUT_COST = 0.30 / 1_000_000  # $0.30 per 1M output tokens
 
+GEMINI_MODEL = 'gemini-2.0-flash'
+
+# Tokens reserved for the reply when admitting a generation (settled with the actual usage)
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("EXPECTED_OUTPUT_TOKENS", "512"))
+
+_model = None
+
+def get_model():
+    """The shared Gemini model handle (created on first use, then reused)"""
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(GEMINI_MODEL)
+    return _model
+
 def generate_response(system_instructions: str, context: str, user_message: str) -> str:
     """Generate a response using Google Gemini"""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_model()
         
         # Combine system instructions, context, and user message
         prompt = f"{system_instructions}\n\nContext: {context}\n\nQuestion: {user_message}"
         
-        response = model.generate_content(prompt)
+        response = generation_lane.call(
+            model.generate_content, prompt, request_options=REQUEST_OPTIONS,
+            cost=reserved_tokens(prompt)
+        )
         
         return response.text
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Error generating response: {e}")
         return "Sorry, an error occurred. Please try again."
 
-def generate_response_with_tokens(system_instructions: str, context: str, user_message: str, memory_context: str = "") -> tuple:
-    """Generate a response and return token usage information"""
-    try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Build natural, conversational prompt
-        prompt = f"""{system_instructions}
+def reserved_tokens(prompt: str) -> int:
+    """Tokens to reserve from the generation budget for a prompt"""
+    return estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+
+def build_prompt(system_instructions: str, context: str, user_message: str, memory_context: str = "") -> str:
+    """Build the conversational prompt sent to Gemini"""
+    prompt = f"""{system_instructions}
 
 Here's some relevant information that might help you:
 
 {context}
 """
-        
-        if memory_context:
-            prompt += f"""
+    
+    if memory_context:
+        prompt += f"""
 Our conversation so far:
 
 {memory_context}
 """
-        
-        prompt += f"""
+    
+    prompt += f"""
 Now, the user is asking: {user_message}
 
 Remember to write naturally like a human having a conversation - no robotic language or unnecessary lists. Just explain things clearly in flowing paragraphs, the way you'd talk to a friend. Be warm, genuine, and helpful!"""
+    
+    return prompt
+
+def calculate_token_info(response, prompt: str, response_text: str) -> dict:
+    """Build token usage and cost information for a completed response"""
+    # Extract token usage from response
+    # Note: Gemini API provides token counts in usage_metadata
+    try:
+        prompt_tokens = response.usage_metadata.prompt_token_count
+        completion_tokens = response.usage_metadata.candidates_token_count
+        total_tokens = response.usage_metadata.total_token_count
+    except:
+        # Fallback: estimate tokens if metadata not available
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(response_text)
+        total_tokens = prompt_tokens + completion_tokens
+    
+    # Calculate cost
+    cost = (prompt_tokens * GEMINI_INPUT_COST) + (completion_tokens * GEMINI_OUTPUT_COST)
+    
+    return {
+        "prompt_tokens": int(prompt_tokens),
+        "completion_tokens": int(completion_tokens),
+        "total_tokens": int(total_tokens),
+        "cost": cost,
+        # Local estimate made before sending, to compare with Gemini's count
+        "estimated_prompt_tokens": estimate_tokens(prompt)
+    }
+
+def estimate_token_info(prompt_tokens: int, response_text: str) -> dict:
+    """Token usage and cost estimated locally, for replies cut off before Gemini reported usage"""
+    completion_tokens = estimate_tokens(response_text)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cost": (prompt_tokens * GEMINI_INPUT_COST) + (completion_tokens * GEMINI_OUTPUT_COST),
+        "estimated_prompt_tokens": prompt_tokens
+    }
+
+def generate_response_with_tokens(system_instructions: str, context: str, user_message: str, memory_context: str = "") -> tuple:
+    """Generate a response and return token usage information"""
+    # Build natural, conversational prompt
+    return generate_prompt_with_tokens(build_prompt(system_instructions, context, user_message, memory_context))
+
+def generate_prompt_with_tokens(prompt: str) -> tuple:
+    """Generate a response to a built prompt (see prompt_builder.py) and return token usage information"""
+    try:
+        model = get_model()
         
-        response = model.generate_content(prompt)
-        
-        # Extract token usage from response
-        # Note: Gemini API provides token counts in usage_metadata
-        try:
-            prompt_tokens = response.usage_metadata.prompt_token_count
-            completion_tokens = response.usage_metadata.candidates_token_count
-            total_tokens = response.usage_metadata.total_token_count
-        except:
-            # Fallback: estimate tokens if metadata not available
-            prompt_tokens = len(prompt.split()) * 1.3  # rough estimate
-            completion_tokens = len(response.text.split()) * 1.3
-            total_tokens = prompt_tokens + completion_tokens
-        
-        # Calculate cost
-        cost = (prompt_tokens * GEMINI_INPUT_COST) + (completion_tokens * GEMINI_OUTPUT_COST)
+        response = generation_lane.call(
+            model.generate_content, prompt, request_options=REQUEST_OPTIONS,
+            cost=reserved_tokens(prompt),
+            tokens_used=lambda response: calculate_token_info(response, prompt, response.text)["total_tokens"]
+        )
         
-        token_info = {
-            "prompt_tokens": int(prompt_tokens),
-            "completion_tokens": int(completion_tokens),
-            "total_tokens": int(total_tokens),
-            "cost": cost
-        }
+        token_info = calculate_token_info(response, prompt, response.text)
         
         return response.text, token_info
+    except UpstreamOverloaded:
+        # Shed load is reported to the client (503), not answered with an apology
+        raise
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "Sorry, an error occurred. Please try again.", None
\ No newline at end of file
+        return "Sorry, an error occurred. Please try again.", None
+
+def build_summary_prompt(previous_summary: str, messages: list, max_words: int) -> str:
+    """Build the prompt that folds older messages into a conversation's rolling summary"""
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    return f"""You maintain a running summary of a customer support conversation about IPTV.
+
+Current summary:
+{previous_summary or "(none yet)"}
+
+Messages to add:
+{transcript}
+
+Write the updated summary in at most {max_words} words. Keep what the user asked for, facts they shared about themselves or their setup, answers already given and anything still unresolved. Write plain prose, no lists or headings."""
+
+def summarize_conversation(previous_summary: str, messages: list, max_words: int = 150) -> tuple:
+    """Fold messages into a rolling summary; returns (summary, token_info), or (None, None) on failure"""
+    try:
+        model = get_model()
+        
+        prompt = build_summary_prompt(previous_summary, messages, max_words)
+        
+        # Background work: queues behind chat replies and waits as long as it takes
+        response = generation_lane.call(
+            model.generate_content, prompt, request_options=REQUEST_OPTIONS,
+            cost=reserved_tokens(prompt), priority=BACKGROUND, max_wait=None,
+            tokens_used=lambda response: calculate_token_info(response, prompt, response.text)["total_tokens"]
+        )
+        
+        return response.text.strip(), calculate_token_info(response, prompt, response.text)
+    except Exception as e:
+        print(f"Error summarizing conversation: {e}")
+        return None, None
+
+def stream_prompt_with_tokens(prompt: str):
+    """
+    Stream a response to a built prompt from Gemini as it is generated
+    
+    Yields (text_chunk, None) tuples while tokens arrive, then a final
+    ("", token_info) tuple once the stream has finished. The generation
+    slot is held until the stream ends; only the initial request is retried.
+    """
+    model = get_model()
+    
+    with generation_lane.reserve(reserved_tokens(prompt)) as usage:
+        response = generation_lane.retry(model.generate_content, prompt, stream=True, request_options=REQUEST_OPTIONS)
+        
+        parts = []
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety or finish metadata)
+                continue
+            if text:
+                parts.append(text)
+                yield text, None
+        
+        token_info = calculate_token_info(response, prompt, "".join(parts))
+        usage["tokens"] = token_info["total_tokens"]
+    
+    yield "", token_info
@@ -0,0 +1,124 @@
+"""
+Conversation memory
+
+Each chat turn sees two things about the conversation so far:
+- A rolling summary of older messages, stored in conversation_summaries
+  along with the last message it covers
+- The recent messages the summary does not cover yet: at least the last
+  MEMORY_MESSAGES, fetched with a bounded tail query
+  (db.get_recent_messages), so the reads do not grow with the conversation
+
+Once SUMMARY_MIN_MESSAGES have fallen out of the window, a background job
+folds them into the summary: the previous summary plus only those messages
+go to Gemini (at most SUMMARY_BATCH_MESSAGES per call), so a summary costs
+one call every few turns. Turns never wait for it; until it lands they
+still see the unsummarized messages verbatim.
+
+Configuration (environment variables):
+- MEMORY_MESSAGES: recent messages always included verbatim (default 5)
+- SUMMARY_MIN_MESSAGES: messages outside the window that trigger a summary update (default 6)
+- SUMMARY_BATCH_MESSAGES: messages folded into the summary per Gemini call (default 20)
+- SUMMARY_MAX_WORDS: length limit given to the summarizer (default 150)
+"""
+
+import os
+import threading
+from database.db import (
+    get_recent_messages, get_messages_after, get_conversation_summary,
+    save_conversation_summary, save_token_usage
+)
+from .executor import get_pool
+from .llm_service import summarize_conversation
+
+MEMORY_MESSAGES = int(os.getenv("MEMORY_MESSAGES", "5"))
+SUMMARY_MIN_MESSAGES = max(1, int(os.getenv("SUMMARY_MIN_MESSAGES", "6")))
+SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "20"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "150"))
+
+_scheduled = set()
+_rescheduled = set()
+_lock = threading.Lock()
+stats = {"summaries": 0, "messages_summarized": 0, "failed": 0}
+
+def load_recent_messages(conversation_id: str) -> list:
+    """Recent messages, ending with the current user message (enough to reach the summary)"""
+    return get_recent_messages(conversation_id, MEMORY_MESSAGES + SUMMARY_MIN_MESSAGES)
+
+def load_summary(conversation_id: str):
+    """The conversation's summary row (None if there is none yet)"""
+    return get_conversation_summary(conversation_id)
+
+def unsummarized(messages: list, summary) -> list:
+    """The messages not yet covered by the summary"""
+    if not summary:
+        return messages
+    covered = (summary["last_message_timestamp"], summary["last_message_id"])
+    return [msg for msg in messages if (msg["timestamp"], msg["id"]) > covered]
+
+def needs_summary(recent_messages: list, summary, added: int = 0) -> bool:
+    """Whether enough messages have left the window to update the summary, counting `added` newer ones"""
+    return len(unsummarized(recent_messages, summary)) + added - MEMORY_MESSAGES >= SUMMARY_MIN_MESSAGES
+
+def update_summary(conversation_id: str, user_id: int):
+    """Fold every message that has left the window into the conversation's summary"""
+    row = get_conversation_summary(conversation_id)
+    summary = row["summary"] if row else None
+    after = (row["last_message_timestamp"], row["last_message_id"]) if row else (None, 0)
+    summarized = row["summarized_messages"] if row else 0
+
+    while True:
+        messages = get_messages_after(conversation_id, *after, limit=SUMMARY_BATCH_MESSAGES + MEMORY_MESSAGES)
+        # The newest MEMORY_MESSAGES stay in the window; if the fetch was cut
+        # short, the messages after it keep at least that many in the window
+        batch = messages[:len(messages) - MEMORY_MESSAGES]
+        if len(batch) < SUMMARY_MIN_MESSAGES:
+            return
+
+        new_summary, token_info = summarize_conversation(summary, batch, SUMMARY_MAX_WORDS)
+        if not new_summary:
+            with _lock:
+                stats["failed"] += 1
+            return
+
+        summary = new_summary
+        after = (batch[-1]["timestamp"], batch[-1]["id"])
+        summarized += len(batch)
+        save_conversation_summary(conversation_id, summary, after[0], after[1], summarized)
+        if token_info:
+            save_token_usage(
+                conversation_id, user_id,
+                token_info["prompt_tokens"], token_info["completion_tokens"],
+                token_info["total_tokens"], token_info["cost"]
+            )
+        with _lock:
+            stats["summaries"] += 1
+            stats["messages_summarized"] += len(batch)
+
+def _run_summary(conversation_id: str, user_id: int):
+    while True:
+        try:
+            update_summary(conversation_id, user_id)
+        except Exception as e:
+            print(f"Error summarizing conversation {conversation_id}: {e}")
+            with _lock:
+                stats["failed"] += 1
+        with _lock:
+            # Turns that finished during this run may have pushed more messages out
+            if conversation_id in _rescheduled:
+                _rescheduled.discard(conversation_id)
+                continue
+            _scheduled.discard(conversation_id)
+            return
+
+def schedule_summary(conversation_id: str, user_id: int):
+    """Update the conversation's summary in the background (at most one job per conversation)"""
+    with _lock:
+        if conversation_id in _scheduled:
+            _rescheduled.add(conversation_id)
+            return
+        _scheduled.add(conversation_id)
+    get_pool("background").submit(_run_summary, conversation_id, user_id)
+
+def get_memory_stats() -> dict:
+    with _lock:
+        return {**stats, "pending": len(_scheduled)}
@@ -0,0 +1,133 @@
+"""
+Concurrent stage graphs for request handlers
+
+A handler often has several independent pieces of work (database reads, a
+query embedding, a vector search) before the step that needs them all. A
+Pipeline declares them as Stages with their dependencies and starts every
+stage as soon as the stages it depends on have finished, so independent
+work overlaps and the handler waits for the slowest chain of stages
+instead of the sum of all of them.
+
+- A stage is an async function of the pipeline state: the inputs passed to
+  run() plus the result of every finished stage, by stage name
+- Each stage has its own timeout, measured from when the stage starts
+- A stage with a fallback degrades to it on timeout or error; any other
+  failure cancels the remaining stages and is raised from run()
+
+Must be run on the event loop; blocking work inside stages still goes
+through the executor pools (see executor.py).
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+_MISSING = object()
+
+_pipelines = {}
+
+class StageTimeout(Exception):
+    """A stage without a fallback ran out of time"""
+
+    def __init__(self, pipeline: str, stage: str, timeout: float):
+        super().__init__(f"{pipeline} pipeline stage '{stage}' timed out after {timeout}s")
+        self.stage = stage
+
+class Stage:
+    """One unit of work in a Pipeline"""
+
+    def __init__(self, name: str, func: Callable[[dict], Awaitable[Any]], deps: Sequence[str] = (),
+                 timeout: Optional[float] = None, fallback: Any = _MISSING):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+
+class Pipeline:
+    """A dependency graph of stages, run concurrently"""
+
+    def __init__(self, name: str, stages: Sequence[Stage]):
+        seen = set()
+        for stage in stages:
+            # Dependencies must be declared first, which also rules out cycles
+            if stage.name in seen:
+                raise ValueError(f"Duplicate stage '{stage.name}'")
+            missing = [dep for dep in stage.deps if dep not in seen]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on stages not declared before it: {missing}")
+            seen.add(stage.name)
+        self.name = name
+        self.stages = list(stages)
+        self._stats = {
+            stage.name: {"runs": 0, "timeouts": 0, "errors": 0, "fallbacks": 0, "seconds": 0.0}
+            for stage in stages
+        }
+        self._runs = 0
+        self._seconds = 0.0
+        _pipelines[name] = self
+
+    async def run(self, **inputs) -> dict:
+        """Run every stage and return the state (inputs plus stage results)"""
+        started = time.perf_counter()
+        state = dict(inputs)
+        tasks = {}
+        for stage in self.stages:
+            deps = [tasks[dep] for dep in stage.deps]
+            tasks[stage.name] = asyncio.ensure_future(self._run_stage(stage, state, deps))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # Collect the other stages' outcomes so none is left unretrieved
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        self._runs += 1
+        self._seconds += time.perf_counter() - started
+        return state
+
+    async def _run_stage(self, stage: Stage, state: dict, deps: list):
+        if deps:
+            await asyncio.gather(*deps)
+        stats = self._stats[stage.name]
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(stage.func(state), stage.timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            if stage.fallback is _MISSING:
+                raise StageTimeout(self.name, stage.name, stage.timeout)
+            print(f"{self.name} pipeline stage '{stage.name}' timed out after {stage.timeout}s, using fallback")
+            stats["fallbacks"] += 1
+            result = stage.fallback
+        except Exception as e:
+            stats["errors"] += 1
+            if stage.fallback is _MISSING:
+                raise
+            print(f"{self.name} pipeline stage '{stage.name}' failed ({e}), using fallback")
+            stats["fallbacks"] += 1
+            result = stage.fallback
+        stats["runs"] += 1
+        stats["seconds"] += time.perf_counter() - started
+        state[stage.name] = result
+
+    def stats(self) -> dict:
+        stages = {}
+        for name, stats in self._stats.items():
+            stages[name] = {
+                "runs": stats["runs"],
+                "timeouts": stats["timeouts"],
+                "errors": stats["errors"],
+                "fallbacks": stats["fallbacks"],
+                "avg_ms": round(stats["seconds"] / stats["runs"] * 1000, 3) if stats["runs"] else 0.0
+            }
+        return {
+            "runs": self._runs,
+            "avg_ms": round(self._seconds / self._runs * 1000, 3) if self._runs else 0.0,
+            "stages": stages
+        }
+
+def get_pipeline_stats() -> dict:
+    """Counters of every Pipeline, by name"""
+    return {name: pipeline.stats() for name, pipeline in _pipelines.items()}
@@ -0,0 +1,113 @@
+"""
+Token-budgeted prompt assembly
+
+Builds the chat prompt from the tone instructions, retrieved chunks,
+conversation memory and the user's message, and keeps it within
+PROMPT_TOKEN_BUDGET estimated tokens. When everything does not fit, it
+drops the lowest-ranked chunks and the oldest memory lines (the summary of
+older messages counts as the oldest line), taking from whichever of the
+two currently uses more tokens. The best chunk and the last exchange are
+dropped only if the prompt still does not fit without everything else;
+the instructions and the question are always kept.
+
+Tokens are estimated locally (chunker.estimate_tokens), so packing costs
+no API call. Each plan reports its estimated size before and after
+packing, which feeds the "prompts" counters in /api/admin/metrics.
+
+Configuration (environment variables):
+- PROMPT_TOKEN_BUDGET: estimated tokens allowed per chat prompt (default 2000)
+"""
+
+import os
+import threading
+from .chunker import estimate_tokens
+from .llm_service import build_prompt, GEMINI_INPUT_COST
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+
+NO_CONTEXT = "No specific context available."
+
+# Kept until nothing else is left to drop: the best chunk and the last exchange
+MIN_CHUNKS = 1
+MIN_MEMORY_LINES = 2
+
+_lock = threading.Lock()
+stats = {"prompts": 0, "unpacked_tokens": 0, "prompt_tokens": 0, "packed": 0, "chunks_dropped": 0, "memory_dropped": 0}
+
+def pack_prompt(system_instructions: str, chunks: list, memory: list, user_message: str, budget: int = PROMPT_TOKEN_BUDGET) -> dict:
+    """
+    Fit chunks and memory into the token budget
+
+    Args:
+        system_instructions: Tone instructions
+        chunks: Retrieved chunks, best first
+        memory: Memory lines, oldest first
+        user_message: The user's question
+        budget: Estimated tokens allowed for the whole prompt
+
+    Returns:
+        {"prompt", "prompt_tokens", "unpacked_tokens", "chunks_used",
+        "chunks_dropped", "memory_used", "memory_dropped"}
+    """
+    # Section headers and separators are part of the fixed cost
+    fixed = estimate_tokens(build_prompt(system_instructions, "", user_message, "\n" if memory else ""))
+    chunk_costs = [estimate_tokens(chunk) + 1 for chunk in chunks]
+    memory_costs = [estimate_tokens(line) + 1 for line in memory]
+    chunk_tokens = sum(chunk_costs)
+    memory_tokens = sum(memory_costs)
+
+    kept_chunks = len(chunks)
+    first_memory = 0
+    while fixed + chunk_tokens + memory_tokens > budget:
+        can_drop_chunk = kept_chunks > MIN_CHUNKS
+        can_drop_memory = len(memory) - first_memory > MIN_MEMORY_LINES
+        if not can_drop_chunk and not can_drop_memory:
+            # Still over budget: give up the protected items too, memory first
+            can_drop_memory = first_memory < len(memory)
+            can_drop_chunk = not can_drop_memory and kept_chunks > 0
+            if not can_drop_chunk and not can_drop_memory:
+                break
+        if can_drop_chunk and (not can_drop_memory or chunk_tokens >= memory_tokens):
+            kept_chunks -= 1
+            chunk_tokens -= chunk_costs[kept_chunks]
+        else:
+            memory_tokens -= memory_costs[first_memory]
+            first_memory += 1
+
+    context = "\n\n".join(chunks[:kept_chunks]) or NO_CONTEXT
+    prompt = build_prompt(system_instructions, context, user_message, "\n".join(memory[first_memory:]))
+    prompt_tokens = estimate_tokens(prompt)
+    if kept_chunks < len(chunks) or first_memory:
+        unpacked = estimate_tokens(build_prompt(system_instructions, "\n\n".join(chunks) or NO_CONTEXT, user_message, "\n".join(memory)))
+    else:
+        unpacked = prompt_tokens
+    plan = {
+        "prompt": prompt,
+        "prompt_tokens": prompt_tokens,
+        "unpacked_tokens": unpacked,
+        "chunks_used": kept_chunks,
+        "chunks_dropped": len(chunks) - kept_chunks,
+        "memory_used": len(memory) - first_memory,
+        "memory_dropped": first_memory
+    }
+
+    with _lock:
+        stats["prompts"] += 1
+        stats["unpacked_tokens"] += unpacked
+        stats["prompt_tokens"] += plan["prompt_tokens"]
+        stats["packed"] += bool(plan["chunks_dropped"] or plan["memory_dropped"])
+        stats["chunks_dropped"] += plan["chunks_dropped"]
+        stats["memory_dropped"] += plan["memory_dropped"]
+    return plan
+
+def get_prompt_stats() -> dict:
+    with _lock:
+        prompts = stats["prompts"]
+        saved = stats["unpacked_tokens"] - stats["prompt_tokens"]
+        return {
+            **stats,
+            "budget": PROMPT_TOKEN_BUDGET,
+            "avg_prompt_tokens": round(stats["prompt_tokens"] / prompts, 1) if prompts else 0.0,
+            "avg_tokens_saved": round(saved / prompts, 1) if prompts else 0.0,
+            "estimated_cost_saved": round(max(0, saved) * GEMINI_INPUT_COST, 6)
+        }
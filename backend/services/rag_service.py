@@ -2,148 +2,274 @@
 RAG (Retrieval-Augmented Generation) Service
 
 This service handles:
-- Text chunking and processing
+- Streaming, sentence-aware chunking of the knowledge-base documents (see documents.py, chunker.py)
 - Embedding generation and storage
-- Semantic search using ChromaDB
+- Hybrid search: ChromaDB (or NumPy) vectors fused with a local BM25 index
 
 Embeddings are stored persistently in: backend/data/embeddings_db/
 This allows embeddings to be reused across server restarts without regenerating them.
 """
 
 import os
+import contextlib
+import hashlib
+import threading
 import chromadb
 from pathlib import Path
-from typing import List, Tuple
-from .embedding_service import get_embedding
+from typing import Iterator, List, Optional, Tuple
+from . import chunker
+from .embedding_service import get_embedding, get_embedder_name, EMBEDDING_MODEL
+from .ingestion import sync_collection, start_job
+from .vector_store import NumpyVectorStore
+from .lexical_index import BM25Index, tokenize, reciprocal_rank_fusion
+from .documents import ARTICLE_PATH, DOCUMENTS_DIR, list_documents, document_source, iter_document_text
 
 # Set up persistent storage directory
 STORAGE_DIR = Path(__file__).parent.parent / "data" / "embeddings_db"
 STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 
-# Initialize ChromaDB client with persistent storage
-chroma_client = chromadb.PersistentClient(path=str(STORAGE_DIR))
+# Vector backend: "chroma" (ChromaDB collection) or "numpy" (in-process matrix, see vector_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+# Storage precision of the numpy backend: float32 or int8 (float16 saves memory but queries slowly)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32").lower()
+NUMPY_INDEX_DIR = Path(__file__).parent.parent / "data" / "vector_index"
 
-# Global collection variable
+# ChromaDB client with persistent storage, created on first use
+chroma_client = None
+
+COLLECTION_NAME = "iptv_knowledge"
+
+# Chunker parameters (see chunker.py); part of every chunk id, so changing them re-indexes everything
+CHUNK_TOKENS = chunker.CHUNK_TOKENS
+CHUNK_OVERLAP_TOKENS = chunker.CHUNK_OVERLAP_TOKENS
+
+# Checkpoint manifest for the embedding build (see ingestion.py)
+MANIFEST_PATH = STORAGE_DIR / "ingestion_manifest.json"
+
+# Global collection variable (a Chroma collection or a NumpyVectorStore)
 collection = None
 
-def chunk_text(text: str, chunk_size: int = 400, overlap: int = 75) -> List[str]:
+# Embeddings in the collection as of the last sync (caps n_results)
+collection_size = 0
+
+# BM25 index over the same chunks (see lexical_index.py)
+lexical_index = None
+
+# Identifies the indexed knowledge base; changes whenever the chunks change
+knowledge_version = None
+
+# Short keyword queries (at most this many terms, all known to the index) skip the embedding
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "3"))
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+
+# Words that mark a natural-language question, which goes through the embedding path
+QUESTION_WORDS = {"what", "how", "why", "when", "where", "who", "which", "can", "does", "do", "is", "are", "should"}
+
+# How queries were answered: keyword fast path, hybrid fusion, or lexical fallback when embedding failed
+retrieval_stats = {"lexical_only": 0, "hybrid": 0, "lexical_fallback": 0}
+_stats_lock = threading.Lock()
+
+# Serializes startup and admin-triggered syncs
+_sync_lock = threading.Lock()
+
+def open_vector_store(embedder_name: str):
     """
-    Split text into chunks with overlap
-    
-    Args:
-        text: Text to chunk
-        chunk_size: Size of each chunk in characters
-        overlap: Number of characters to overlap between chunks
-    
-    Returns:
-        List of text chunks
+    Open the configured vector backend for vectors from embedder_name
+
+    Both backends expose the same collection interface: name, metadata,
+    modify(), count(), get(), add(), update(), delete() and query() with
+    Chroma's argument and result shapes. The embedder is recorded in the
+    collection metadata; a collection built by another embedder is emptied
+    (and then rebuilt by the sync), so vectors from two embedders never
+    share an index. Collections from before embedders were recorded were
+    built by Gemini. Returns (collection, manifest path).
     """
-    chunks = []
-    start = 0
-    text_length = len(text)
+    global chroma_client
     
-    while start < text_length:
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        # Try to break at sentence or word boundary
-        if end < text_length:
-            # Look for sentence end
-            last_period = chunk.rfind('.')
-            last_newline = chunk.rfind('\n')
-            break_point = max(last_period, last_newline)
-            
-            if break_point > chunk_size * 0.5:  # At least 50% through the chunk
-                chunk = text[start:start + break_point + 1]
-                end = start + break_point + 1
-        
-        chunks.append(chunk.strip())
-        start = end - overlap
+    if VECTOR_BACKEND == "numpy":
+        store = NumpyVectorStore(NUMPY_INDEX_DIR / VECTOR_DTYPE, COLLECTION_NAME, VECTOR_DTYPE)
+        opened, manifest_path = store, store.path / "ingestion_manifest.json"
+    elif VECTOR_BACKEND == "chroma":
+        if chroma_client is None:
+            chroma_client = chromadb.PersistentClient(path=str(STORAGE_DIR))
+        opened, manifest_path = chroma_client.get_or_create_collection(name=COLLECTION_NAME), MANIFEST_PATH
+    else:
+        raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND} (expected 'chroma' or 'numpy')")
     
-    return chunks
+    metadata = dict(opened.metadata or {})
+    recorded = metadata.get("embedder") or (EMBEDDING_MODEL if opened.count() else None)
+    if recorded is not None and recorded != embedder_name:
+        print(f"⚠️ Collection was built with {recorded}, now using {embedder_name}; rebuilding it")
+        if VECTOR_BACKEND == "numpy":
+            opened.reset()
+        else:
+            # Chroma keeps a collection's dimension after its rows are deleted
+            chroma_client.delete_collection(name=COLLECTION_NAME)
+            opened = chroma_client.create_collection(name=COLLECTION_NAME)
+            metadata = {}
+    if metadata.get("embedder") != embedder_name:
+        metadata["embedder"] = embedder_name
+        opened.modify(metadata=metadata)
+    return opened, manifest_path
 
-def initialize_rag():
-    """Initialize the RAG system by loading and processing the article"""
-    global collection
-    
-    # Load article
-    article_path = Path(__file__).parent.parent / "data" / "article.txt"
-    
-    if not article_path.exists():
-        raise FileNotFoundError(f"Article not found at {article_path}")
-    
-    with open(article_path, 'r', encoding='utf-8') as f:
-        article_text = f.read()
+def chunk_id(chunk_hash: str, source: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> str:
+    """Content-addressed id for a chunk (hash of its text hash, source and the chunker parameters)"""
+    raw = f"tokens-v2:{max_tokens}:{overlap_tokens}\x00{source}\x00{chunk_hash}"
+    return "c_" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def iter_chunk_records() -> Iterator[Tuple[str, str, dict]]:
+    """Stream (id, chunk, metadata) for every chunk of every knowledge-base document"""
+    for path in list_documents():
+        source = document_source(path)
+        for chunk in chunker.iter_chunks(iter_document_text(path), CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS):
+            metadata = {"source": source, "start": chunk["start"], "end": chunk["end"], "tokens": chunk["tokens"]}
+            yield chunk_id(chunk["hash"], source, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS), chunk["text"], metadata
+
+def sync_knowledge_base(progress: dict = None) -> dict:
+    """
+    Sync the embeddings collection with the knowledge-base documents
+
+    Only new chunks are embedded and removed chunks deleted; unchanged chunks
+    are kept. Returns the sync summary (also written to `progress`).
+    """
+    global collection, collection_size, knowledge_version, lexical_index
     
-    # Chunk the text
-    chunks = chunk_text(article_text)
-    print(f"Created {len(chunks)} chunks from article")
+    if not list_documents():
+        raise FileNotFoundError(f"No knowledge-base documents found (expected {ARTICLE_PATH} or files in {DOCUMENTS_DIR})")
     
-    # Create or get collection (will load from persistent storage if exists)
-    try:
-        collection = chroma_client.get_collection(name="iptv_knowledge")
-        print(f"✅ Loaded existing embeddings from persistent storage: {STORAGE_DIR}")
-        print(f"   Collection contains {collection.count()} embeddings")
-    except:
-        collection = chroma_client.create_collection(name="iptv_knowledge")
+    with _sync_lock:
+        chunks_by_id = {}
+        def records():
+            for record in iter_chunk_records():
+                chunks_by_id.setdefault(record[0], record[1])
+                yield record
+        
+        # Open the collection (will load from persistent storage if exists),
+        # emptying it if another embedder built it
+        embedder_name = get_embedder_name()
+        synced_collection, manifest_path = open_vector_store(embedder_name)
+        # The numpy store keeps the sync's writes in memory and saves them once at the end
+        with getattr(synced_collection, "deferred_writes", contextlib.nullcontext)():
+            summary = sync_collection(synced_collection, records(), manifest_path, progress, embedder_name)
+        print(f"Indexed {summary['chunks']} chunks from {summary['documents']} documents")
         
-        # Generate embeddings and add to collection
-        print("🔄 Generating embeddings for chunks...")
-        for i, chunk in enumerate(chunks):
-            embedding = get_embedding(chunk)
-            if embedding:
-                collection.add(
-                    embeddings=[embedding],
-                    documents=[chunk],
-                    ids=[f"chunk_{i}"]
-                )
-            
-            # Progress indicator
-            if (i + 1) % 5 == 0:
-                print(f"   Processed {i + 1}/{len(chunks)} chunks...")
+        # Lexical index over the same chunks (including any that failed to embed)
+        lexical_index = BM25Index(list(chunks_by_id), list(chunks_by_id.values()))
         
-        print(f"✅ Saved {len(chunks)} embeddings to persistent storage: {STORAGE_DIR}")
+        collection = synced_collection
+        collection_size = synced_collection.count()
+        knowledge_version = hashlib.sha256(
+            "\x00".join([embedder_name] + sorted(chunks_by_id)).encode("utf-8")
+        ).hexdigest()[:16]
     
+    return summary
+
+def start_reindex_job() -> dict:
+    """Sync the knowledge base on a background thread; returns the job to poll"""
+    return start_job(sync_knowledge_base)
+
+def initialize_rag():
+    """Initialize the RAG system by syncing embeddings with the knowledge-base documents"""
+    sync_knowledge_base()
     return collection
 
-def search_knowledge(query: str, top_k: int = 3) -> Tuple[List[str], float]:
+def get_knowledge_version() -> str:
+    """Get the version of the indexed knowledge base"""
+    if knowledge_version is None:
+        initialize_rag()
+    return knowledge_version
+
+def is_keyword_query(query: str, index: BM25Index) -> bool:
+    """Short, non-question queries whose terms all appear in the knowledge base"""
+    terms = tokenize(query)
+    return (
+        0 < len(terms) <= LEXICAL_FAST_PATH_MAX_TERMS
+        and "?" not in query
+        and terms[0] not in QUESTION_WORDS
+        and all(index.has_term(term) for term in terms)
+    )
+
+def _count(path: str):
+    with _stats_lock:
+        retrieval_stats[path] += 1
+
+def get_retrieval_stats() -> dict:
+    with _stats_lock:
+        return dict(retrieval_stats)
+
+def needs_query_embedding(query: str) -> bool:
+    """Whether search_knowledge would embed this query (False on the keyword-only path)"""
+    if collection is None:
+        initialize_rag()
+    return not is_keyword_query(query, lexical_index)
+
+def search_knowledge(query: str, top_k: int = 3, query_embedding: Optional[List[float]] = None,
+                     allow_embed: bool = True) -> Tuple[List[str], float]:
     """
     Search for relevant chunks given a query
     
+    Vector and BM25 results are merged with reciprocal-rank fusion. Short
+    keyword queries are answered from the BM25 index alone, without an
+    embedding request, as are all queries when the embedding fails.
+    
     Args:
         query: User's question
         top_k: Number of top results to return
+        query_embedding: Precomputed embedding of the query (embedded here when None)
+        allow_embed: False when the caller already tried to embed the query
+            (e.g. its embedding stage timed out); a missing embedding then
+            falls back to BM25 instead of calling the embedding API again
     
     Returns:
-        Tuple of (list of relevant chunks, average similarity score)
+        Tuple of (list of relevant chunks, average similarity score of the
+        vector matches among them; 0.0 for lexical-only results)
     """
     global collection
     
     if collection is None:
         initialize_rag()
+    index = lexical_index
+    
+    candidates = max(top_k, HYBRID_CANDIDATES)
+    lexical = [(index.ids[i], index.documents[i]) for i, _ in index.search(query, candidates)]
+    
+    if lexical and is_keyword_query(query, index):
+        _count("lexical_only")
+        return [document for _, document in lexical[:top_k]], 0.0
     
     # Generate embedding for query
-    query_embedding = get_embedding(query)
+    if query_embedding is None and allow_embed:
+        query_embedding = get_embedding(query)
     
     if not query_embedding:
-        return [], 0.0
+        _count("lexical_fallback")
+        return [document for _, document in lexical[:top_k]], 0.0
     
     # Search in collection
     results = collection.query(
         query_embeddings=[query_embedding],
-        n_results=top_k
+        n_results=min(candidates, max(1, collection_size))
     )
     
-    # Extract documents and calculate average distance
+    ids = results['ids'][0] if results['ids'] else []
     documents = results['documents'][0] if results['documents'] else []
     distances = results['distances'][0] if results['distances'] else []
     
     # Convert distance to similarity (ChromaDB uses cosine distance)
     # Similarity = 1 - distance (for normalized vectors)
-    similarities = [1 - d for d in distances] if distances else []
+    similarity_by_id = {chunk_id: 1 - d for chunk_id, d in zip(ids, distances)}
+    document_by_id = dict(lexical)
+    document_by_id.update(zip(ids, documents))
+    
+    fused = reciprocal_rank_fusion([ids, [chunk_id for chunk_id, _ in lexical]], RRF_K)[:top_k]
+    _count("hybrid")
+    
+    similarities = [similarity_by_id[chunk_id] for chunk_id in fused if chunk_id in similarity_by_id]
     avg_similarity = sum(similarities) / len(similarities) if similarities else 0.0
     
-    return documents, avg_similarity
+    return [document_by_id[chunk_id] for chunk_id in fused], avg_similarity
 
 def get_conversation_context(conversation_history: List[dict], max_messages: int = 5) -> str:
     """
@@ -0,0 +1,71 @@
+"""
+Single-flight coalescing of concurrent identical calls
+
+When many users ask the same question at the same moment, each request
+would otherwise embed it, search the knowledge base and call Gemini on its
+own. A SingleFlight keeps one task per key while it is running: the first
+caller (the leader) starts it and every caller that arrives with the same
+key before it finishes awaits that same task instead of issuing another
+upstream call. Nothing is kept once the task completes; repeats after that
+are the caches' job (embedding_cache.py, answer_cache.py).
+
+The shared task is shielded, so a leader whose client disconnects does not
+cancel the work the other callers are waiting on. Errors are shared too:
+every caller waiting on a failed task gets its exception.
+
+Calls must be made from the event loop; the blocking work itself still runs
+in the executor pools (see executor.py).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+_flights = {}
+
+class SingleFlight:
+    """In-flight deduplication of async calls by key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks = {}
+        self._stats = {"calls": 0, "collapsed": 0}
+        _flights[name] = self
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await func() once per concurrent key
+
+        Returns:
+            Tuple of (result, shared); shared is True when the result came
+            from a call started by another request
+        """
+        self._stats["calls"] += 1
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self._stats["collapsed"] += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        calls = self._stats["calls"]
+        return {
+            **self._stats,
+            "upstream_calls": calls - self._stats["collapsed"],
+            "in_flight": len(self._tasks),
+            "collapse_rate": self._stats["collapsed"] / calls if calls else 0.0
+        }
+
+def get_single_flight_stats() -> dict:
+    """Counters of every SingleFlight, by name"""
+    return {name: flight.stats() for name, flight in _flights.items()}
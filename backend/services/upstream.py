@@ -0,0 +1,265 @@
+"""
+Admission control for Gemini calls
+
+Embeddings and generations each go through their own UpstreamLane, which
+keeps throughput at the quota ceiling instead of answering a burst with a
+storm of 429s:
+- Bounded concurrency: at most max_concurrency calls in flight
+- Token-rate budget: a token bucket refilled at tokens_per_minute; each call
+  reserves its estimated tokens and is settled with the actual usage
+- Priority queue: callers wait in (priority, arrival) order, so chat
+  requests go ahead of background ingestion, for at most max_wait seconds
+- Load shedding: when the queue is full, or a caller waits too long,
+  UpstreamOverloaded is raised with a retry_after hint (the chat routes turn
+  it into a 503 with a Retry-After header)
+- Retries: rate-limit, server and timeout errors are retried with jittered
+  exponential backoff, and the whole lane pauses for the backoff so the
+  other queued calls do not hit the same limit
+
+Calls block, so they run in the executor pools (see executor.py).
+
+Configuration (environment variables):
+- EMBEDDING_MAX_CONCURRENCY / GENERATION_MAX_CONCURRENCY: calls in flight
+  (default 16 / 32)
+- EMBEDDING_TOKENS_PER_MINUTE / GENERATION_TOKENS_PER_MINUTE: token budget,
+  0 for none (default 1000000 / 1000000)
+- UPSTREAM_QUEUE_SIZE: callers allowed to wait per lane (default 200)
+- UPSTREAM_MAX_QUEUE_SECONDS: longest wait of an interactive call (default 10)
+- UPSTREAM_MAX_RETRIES: retries of a failed call (default 3)
+- UPSTREAM_BACKOFF_BASE / UPSTREAM_BACKOFF_MAX: backoff bounds in seconds
+  (default 0.5 / 8)
+- GEMINI_TIMEOUT: timeout of each Gemini request in seconds (default 30)
+"""
+
+from contextlib import contextmanager
+import heapq
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+from google.api_core import exceptions as google_exceptions
+
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "16"))
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "32"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+GENERATION_TOKENS_PER_MINUTE = int(os.getenv("GENERATION_TOKENS_PER_MINUTE", "1000000"))
+UPSTREAM_QUEUE_SIZE = int(os.getenv("UPSTREAM_QUEUE_SIZE", "200"))
+UPSTREAM_MAX_QUEUE_SECONDS = float(os.getenv("UPSTREAM_MAX_QUEUE_SECONDS", "10"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+
+# Queue priorities (lower goes first)
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Passed to every Gemini request
+REQUEST_OPTIONS = {"timeout": GEMINI_TIMEOUT}
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+class UpstreamOverloaded(Exception):
+    """A call was shed because its lane is saturated"""
+
+    def __init__(self, lane: str, retry_after: float):
+        super().__init__(f"{lane} upstream is overloaded, retry after {retry_after:.1f}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Whole seconds, as the Retry-After header expects"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+class UpstreamLane:
+    """Concurrency, token-rate and queue limits for one kind of upstream call"""
+
+    def __init__(self, name: str, max_concurrency: int, tokens_per_minute: int,
+                 queue_size: int = UPSTREAM_QUEUE_SIZE, max_wait: float = UPSTREAM_MAX_QUEUE_SECONDS):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.capacity = tokens_per_minute
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._rate = tokens_per_minute / 60.0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._active = 0
+        self._waiting = []  # heap of [priority, seq, cost]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {"dispatched": 0, "rejected": 0, "timed_out": 0, "retries": 0, "errors": 0, "wait_seconds": 0.0}
+
+    def _refill(self, now: float):
+        if self.capacity:
+            self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+
+    def _delay(self, cost: int, now: float) -> float:
+        """Seconds until a call of this cost may start, ignoring the queue (0 if now)"""
+        delay = max(0.0, self._paused_until - now)
+        if self.capacity:
+            needed = min(cost, self.capacity)
+            if self._tokens < needed:
+                delay = max(delay, (needed - self._tokens) / self._rate)
+        return delay
+
+    def _retry_after(self, now: float) -> float:
+        """Rough time until the queue ahead has drained"""
+        queued = sum(entry[2] for entry in self._waiting)
+        drain = queued / self._rate if self.capacity else 0.0
+        return max(1.0, self._paused_until - now, drain)
+
+    def check_admission(self):
+        """Raise UpstreamOverloaded if a new call would be shed right away"""
+        with self._cond:
+            if len(self._waiting) >= self.queue_size:
+                self._stats["rejected"] += 1
+                raise UpstreamOverloaded(self.name, self._retry_after(time.monotonic()))
+
+    def acquire(self, cost: int, priority: int = INTERACTIVE, max_wait: Optional[float] = -1):
+        """
+        Wait for a slot and cost tokens
+
+        Args:
+            cost: Estimated tokens of the call
+            priority: Queue priority (INTERACTIVE or BACKGROUND)
+            max_wait: Longest wait in seconds; -1 for the lane default, None to wait indefinitely
+        """
+        if max_wait == -1:
+            max_wait = self.max_wait
+        started = time.monotonic()
+        deadline = None if max_wait is None else started + max_wait
+        with self._cond:
+            if len(self._waiting) >= self.queue_size:
+                self._stats["rejected"] += 1
+                raise UpstreamOverloaded(self.name, self._retry_after(started))
+            entry = [priority, next(self._seq), cost]
+            heapq.heappush(self._waiting, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._delay(cost, now)
+                if self._waiting[0] is entry and self._active < self.max_concurrency and delay == 0:
+                    break
+                if deadline is not None and now >= deadline:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._stats["timed_out"] += 1
+                    self._cond.notify_all()
+                    raise UpstreamOverloaded(self.name, self._retry_after(now))
+                timeout = delay if delay and self._waiting[0] is entry else None
+                if deadline is not None:
+                    timeout = min(timeout or deadline - now, deadline - now)
+                self._cond.wait(timeout)
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._tokens -= cost
+            self._stats["dispatched"] += 1
+            self._stats["wait_seconds"] += now - started
+            # The next caller may be able to start too
+            self._cond.notify_all()
+
+    def release(self, reserved: int, used: int):
+        """Free a slot and settle the reservation with the tokens actually used"""
+        with self._cond:
+            self._active -= 1
+            self._tokens = min(self.capacity, self._tokens + reserved - used) if self.capacity else 0.0
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold back every queued call for a while (after a rate-limit or server error)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, cost: int, priority: int = INTERACTIVE, max_wait: Optional[float] = -1):
+        """
+        Hold a slot for the duration of the block
+
+        Yields a dict whose "tokens" entry can be set to the actual usage.
+        """
+        self.acquire(cost, priority, max_wait)
+        usage = {"tokens": cost}
+        try:
+            yield usage
+        finally:
+            self.release(cost, usage["tokens"])
+
+    def retry(self, func: Callable, *args, **kwargs):
+        """Call func, retrying retryable errors with jittered exponential backoff"""
+        for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt == UPSTREAM_MAX_RETRIES:
+                    self._count("errors")
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"{self.name} call failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                self._count("retries")
+                self.pause(delay)
+                time.sleep(delay)
+            except Exception:
+                self._count("errors")
+                raise
+
+    def call(self, func: Callable, *args, cost: int, priority: int = INTERACTIVE,
+             max_wait: Optional[float] = -1, tokens_used: Optional[Callable] = None, **kwargs):
+        """
+        Run one upstream call within the lane's limits, with retries
+
+        tokens_used, if given, maps the result to the tokens it actually cost.
+        """
+        with self.reserve(cost, priority, max_wait) as usage:
+            result = self.retry(func, *args, **kwargs)
+            if tokens_used is not None:
+                usage["tokens"] = tokens_used(result)
+            return result
+
+    def _count(self, name: str):
+        with self._cond:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            dispatched = self._stats["dispatched"]
+            return {
+                "dispatched": dispatched,
+                "rejected": self._stats["rejected"],
+                "timed_out": self._stats["timed_out"],
+                "retries": self._stats["retries"],
+                "errors": self._stats["errors"],
+                "active": self._active,
+                "queued": len(self._waiting),
+                "tokens_available": int(self._tokens) if self.capacity else None,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "avg_wait_ms": round(self._stats["wait_seconds"] / dispatched * 1000, 3) if dispatched else 0.0
+            }
+
+embedding_lane = UpstreamLane("embedding", EMBEDDING_MAX_CONCURRENCY, EMBEDDING_TOKENS_PER_MINUTE)
+generation_lane = UpstreamLane("generation", GENERATION_MAX_CONCURRENCY, GENERATION_TOKENS_PER_MINUTE)
+
+def get_upstream_stats() -> dict:
+    return {"embedding": embedding_lane.stats(), "generation": generation_lane.stats()}
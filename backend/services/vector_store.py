@@ -0,0 +1,323 @@
+"""
+In-process NumPy vector store
+
+An alternative to ChromaDB for small and medium knowledge bases. All
+embeddings live in one contiguous matrix (rows L2-normalized, so a dot
+product is the cosine similarity) and top-k search is a single
+matrix-vector product plus argpartition.
+
+The matrix can be stored as float32 or int8 (a quarter of the memory, with
+one float32 scale per row; int8 rows are widened to float32 block by block
+at query time). float16 is also accepted but is memory-only: NumPy has no
+fast float16 matrix product, so it halves the memory at several times the
+query latency of float32 and is not recommended; use int8 to save memory.
+
+The matrix is persisted as a .npy file and memory-mapped on load, so
+startup does not copy it. Each save writes a new version of the files and
+then, last, a small marker naming that version and its row count, so a
+crash mid-save leaves the previous version in place. Inside
+deferred_writes() mutations stay in memory and are saved once when the
+block ends; syncs use it so a build does not rewrite the matrix per batch.
+
+NumpyVectorStore implements the subset of the Chroma collection API that
+ingestion and search use (name, metadata, modify, count, get, add, update,
+delete, query),
+so it can be swapped in for a Chroma collection (see rag_service.py).
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows scored per step for float16/int8, bounding the float32 temporary
+_SCORE_BLOCK_ROWS = 8192
+
+class NumpyVectorStore:
+    """Contiguous embedding matrix with brute-force cosine top-k"""
+
+    def __init__(self, path: Path, name: str, dtype: str = "float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype} (expected one of {', '.join(VECTOR_DTYPES)})")
+        self.path = Path(path)
+        self.name = name
+        self.dtype = dtype
+        self.metadata = None
+        self._lock = threading.RLock()
+        # Swapped as a whole on every mutation, so queries read a consistent snapshot
+        self._state = self._empty_state()
+        # Saved version (0 = nothing saved yet)
+        self._version = 0
+        # Inside deferred_writes(): added batches not merged into the matrix yet, and unsaved changes
+        self._deferred = 0
+        self._pending = []
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def _empty_state() -> dict:
+        return {"ids": [], "documents": [], "metadatas": [], "vectors": None, "scales": None, "positions": {}}
+
+    def _file(self, kind: str, version: int) -> Path:
+        suffix = "json" if kind == "index" else "npy"
+        return self.path / f"{kind}-{version}.{suffix}"
+
+    def _marker(self) -> Path:
+        return self.path / "current.json"
+
+    def _load(self):
+        marker_path = self._marker()
+        if not marker_path.exists():
+            if (self.path / "index.json").exists():
+                # Layout from before versioned saves; rebuild on the next sync
+                print(f"⚠️ Vector index at {self.path} uses an old layout; it will be rebuilt")
+            return
+        with open(marker_path, "r", encoding="utf-8") as f:
+            marker = json.load(f)
+        version, rows = marker["version"], marker["rows"]
+        self._version = version
+        try:
+            with open(self._file("index", version), "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.metadata = index.get("metadata")
+            if marker.get("dtype") != self.dtype:
+                # Stored with another precision; rebuild on the next sync
+                print(f"⚠️ Vector index at {self.path} uses {marker.get('dtype')}, expected {self.dtype}; it will be rebuilt")
+                return
+            vectors = np.load(self._file("vectors", version), mmap_mode="r") if rows else None
+            scales = np.load(self._file("scales", version), mmap_mode="r") if rows and self.dtype == "int8" else None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Vector index at {self.path} is unreadable ({e}); it will be rebuilt")
+            return
+        if len(index["ids"]) != rows or (vectors is not None and len(vectors) != rows) or (scales is not None and len(scales) != rows):
+            print(f"⚠️ Vector index at {self.path} does not match its marker; it will be rebuilt")
+            return
+        self._state = {
+            "ids": index["ids"],
+            "documents": index["documents"],
+            "metadatas": index["metadatas"],
+            "vectors": vectors,
+            "scales": scales,
+            "positions": {chunk_id: i for i, chunk_id in enumerate(index["ids"])}
+        }
+
+    @staticmethod
+    def _replace(path: Path, write):
+        """Write a file through a temp file and rename it into place"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _save(self, state: dict):
+        """Persist state as a new version; the marker is written last, so a crash keeps the previous one"""
+        if self._deferred:
+            self._dirty = True
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        version = self._version + 1
+        if state["vectors"] is not None:
+            self._replace(self._file("vectors", version), lambda f: np.save(f, state["vectors"]))
+            if state["scales"] is not None:
+                self._replace(self._file("scales", version), lambda f: np.save(f, state["scales"]))
+        index = {"metadata": self.metadata, "ids": state["ids"], "documents": state["documents"], "metadatas": state["metadatas"]}
+        self._replace(self._file("index", version), lambda f: f.write(json.dumps(index).encode("utf-8")))
+        marker = {"version": version, "rows": len(state["ids"]), "dtype": self.dtype}
+        self._replace(self._marker(), lambda f: f.write(json.dumps(marker).encode("utf-8")))
+        self._version = version
+        self._dirty = False
+
+        # Older versions are no longer referenced (open memory maps keep their data)
+        for kind in ("vectors", "scales", "index"):
+            for old in self.path.glob(f"{kind}-*"):
+                if old.name.split("-", 1)[1].split(".", 1)[0] != str(version):
+                    try:
+                        old.unlink()
+                    except OSError:
+                        pass
+
+    @contextmanager
+    def deferred_writes(self):
+        """Keep mutations in memory and save them once when the block ends (also on error)"""
+        with self._lock:
+            self._deferred += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._deferred -= 1
+                if not self._deferred:
+                    self._merge_pending()
+                    if self._dirty:
+                        self._save(self._state)
+
+    def _merge_pending(self):
+        """Append the batches added inside deferred_writes() to the matrix in one step"""
+        if not self._pending:
+            return
+        state, pending = self._state, self._pending
+        self._pending = []
+        vectors = [state["vectors"]] if state["vectors"] is not None else []
+        scales = [state["scales"]] if state["scales"] is not None else []
+        new_state = {
+            "ids": state["ids"] + [chunk_id for batch in pending for chunk_id in batch["ids"]],
+            "documents": state["documents"] + [document for batch in pending for document in batch["documents"]],
+            "metadatas": state["metadatas"] + [metadata for batch in pending for metadata in batch["metadatas"]],
+            "vectors": np.concatenate(vectors + [batch["vectors"] for batch in pending]),
+            "scales": None if pending[0]["scales"] is None else np.concatenate(scales + [batch["scales"] for batch in pending])
+        }
+        new_state["positions"] = {chunk_id: i for i, chunk_id in enumerate(new_state["ids"])}
+        self._state = new_state
+
+    def _current(self) -> dict:
+        """The state including rows added inside deferred_writes()"""
+        if self._pending:
+            with self._lock:
+                self._merge_pending()
+        return self._state
+
+    def _encode(self, embeddings: List[list]):
+        """Normalize rows and convert to the storage dtype; returns (vectors, scales)"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(VECTOR_DTYPES[self.dtype]), None
+
+    def reset(self):
+        """Remove every record (the dimension is free to change afterwards)"""
+        with self._lock:
+            self._pending = []
+            self._state = self._empty_state()
+            self._save(self._state)
+
+    def modify(self, metadata: dict):
+        """Replace the collection metadata"""
+        with self._lock:
+            self.metadata = dict(metadata)
+            self._save(self._current())
+
+    def count(self) -> int:
+        return len(self._current()["ids"])
+
+    def get(self, ids: List[str] = None, where: dict = None, limit: int = None, include: List[str] = None) -> dict:
+        """Stored records, optionally filtered by id or by exact metadata match"""
+        include = ["metadatas", "documents"] if include is None else include
+        state = self._current()
+        if ids is not None:
+            positions = [state["positions"][chunk_id] for chunk_id in ids if chunk_id in state["positions"]]
+        else:
+            positions = range(len(state["ids"]))
+        if where:
+            positions = [i for i in positions if all(state["metadatas"][i].get(k) == v for k, v in where.items())]
+        positions = list(positions)[:limit] if limit else list(positions)
+        return {
+            "ids": [state["ids"][i] for i in positions],
+            "documents": [state["documents"][i] for i in positions] if "documents" in include else None,
+            "metadatas": [state["metadatas"][i] for i in positions] if "metadatas" in include else None,
+            "embeddings": None
+        }
+
+    def add(self, ids: List[str], embeddings: List[list], documents: List[str], metadatas: List[dict] = None):
+        vectors, scales = self._encode(embeddings)
+        batch = {
+            "ids": list(ids),
+            "documents": list(documents),
+            "metadatas": list(metadatas or [{} for _ in ids]),
+            "vectors": vectors,
+            "scales": scales
+        }
+        with self._lock:
+            existing = self._pending[0]["vectors"] if self._pending else self._state["vectors"]
+            if existing is not None and existing.shape[1] != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {existing.shape[1]}")
+            self._pending.append(batch)
+            if self._deferred:
+                self._dirty = True
+                return
+            self._merge_pending()
+            self._save(self._state)
+
+    def update(self, ids: List[str], metadatas: List[dict]):
+        with self._lock:
+            state = self._state
+            new_metadatas = list(state["metadatas"])
+            for chunk_id, metadata in zip(ids, metadatas):
+                if chunk_id in state["positions"]:
+                    new_metadatas[state["positions"][chunk_id]] = metadata
+                else:
+                    # Rows added inside deferred_writes() and not merged yet
+                    for batch in self._pending:
+                        if chunk_id in batch["ids"]:
+                            batch["metadatas"][batch["ids"].index(chunk_id)] = metadata
+            new_state = dict(state, metadatas=new_metadatas)
+            self._state = new_state
+            self._save(new_state)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            state = self._current()
+            removed = {state["positions"][chunk_id] for chunk_id in ids if chunk_id in state["positions"]}
+            if not removed:
+                return
+            keep = [i for i in range(len(state["ids"])) if i not in removed]
+            new_state = {
+                "ids": [state["ids"][i] for i in keep],
+                "documents": [state["documents"][i] for i in keep],
+                "metadatas": [state["metadatas"][i] for i in keep],
+                "vectors": np.ascontiguousarray(state["vectors"][keep]) if keep else None,
+                "scales": np.ascontiguousarray(state["scales"][keep]) if keep and state["scales"] is not None else None
+            }
+            new_state["positions"] = {chunk_id: i for i, chunk_id in enumerate(new_state["ids"])}
+            self._state = new_state
+            self._save(new_state)
+
+    @staticmethod
+    def _scores(state: dict, query: np.ndarray) -> np.ndarray:
+        vectors = state["vectors"]
+        if vectors.dtype == np.float32:
+            return vectors @ query
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), _SCORE_BLOCK_ROWS):
+            block = vectors[start:start + _SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + _SCORE_BLOCK_ROWS] = block @ query
+        if state["scales"] is not None:
+            scores *= state["scales"]
+        return scores
+
+    def query(self, query_embeddings: List[list], n_results: int = 10, include: List[str] = None) -> dict:
+        """
+        Top-k by cosine similarity, returned in Chroma's result shape
+
+        Distances are cosine distances (1 - similarity).
+        """
+        state = self._current()
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            if state["vectors"] is None:
+                for key in results:
+                    results[key].append([])
+                continue
+            query = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            query = query / norm if norm else query
+
+            scores = self._scores(state, query)
+            k = min(n_results, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results["ids"].append([state["ids"][i] for i in top])
+            results["documents"].append([state["documents"][i] for i in top])
+            results["metadatas"].append([state["metadatas"][i] for i in top])
+            results["distances"].append([float(1 - scores[i]) for i in top])
+        return results
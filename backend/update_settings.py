@@ -1,27 +1,16 @@
-import sqlite3
-from pathlib import Path
+from database import db
 
-DB_PATH = Path(__file__).parent / "database" / "chatbot.db"
+db.init_database()
 
-conn = sqlite3.connect(str(DB_PATH))
-cursor = conn.cursor()
+# save_settings bumps settings_version, so running workers reload on their next read
+db.save_settings({
+    # Update fallback message
+    "fallback_message": "I don't have specific information about that in my knowledge base, but I'd be happy to help with general questions or other topics!",
+    # Update tone instructions
+    "tone_instructions": "You are a helpful, friendly AI assistant. Always try to answer questions based on the context provided. If the context doesn't contain the exact answer, use your general knowledge to provide a helpful response. Be conversational, warm, and informative. Keep responses clear and concise but comprehensive. If you truly cannot answer something, politely say so and ask if there's another way you can help.",
+})
 
-# Update fallback message
-cursor.execute("""
-    UPDATE settings 
-    SET value = 'I don''t have specific information about that in my knowledge base, but I''d be happy to help with general questions or other topics!' 
-    WHERE key = 'fallback_message'
-""")
-
-# Update tone instructions
-cursor.execute("""
-    UPDATE settings 
-    SET value = 'You are a helpful, friendly AI assistant. Always try to answer questions based on the context provided. If the context doesn''t contain the exact answer, use your general knowledge to provide a helpful response. Be conversational, warm, and informative. Keep responses clear and concise but comprehensive. If you truly cannot answer something, politely say so and ask if there''s another way you can help.' 
-    WHERE key = 'tone_instructions'
-""")
-
-conn.commit()
-conn.close()
+db.close_db_connections()
 
 print("Settings updated successfully!")
-print("Please restart the backend server for changes to take effect.")
+print("Running servers pick up the changes on their next request.")
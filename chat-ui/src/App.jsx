@@ -10,6 +10,7 @@ function App() {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(null);
   const [conversations, setConversations] = useState([]);
+  const [conversationsCursor, setConversationsCursor] = useState(null);
   const [activeConversationId, setActiveConversationId] = useState(null);
 
   useEffect(() => {
@@ -39,11 +40,28 @@ function App() {
 
   const loadConversations = async () => {
     try {
-      const convs = await getUserConversations(token);
-      setConversations(Array.isArray(convs) ? convs : []);
+      const { conversations: convs, nextCursor } = await getUserConversations(token);
+      setConversations(convs);
+      setConversationsCursor(nextCursor);
     } catch (error) {
       console.error('Failed to load conversations:', error);
       setConversations([]);
+      setConversationsCursor(null);
+    }
+  };
+
+  // Append the next page when the sidebar is scrolled to the bottom
+  const loadMoreConversations = async () => {
+    if (!conversationsCursor) return;
+    const cursor = conversationsCursor;
+    setConversationsCursor(null);
+    try {
+      const { conversations: convs, nextCursor } = await getUserConversations(token, cursor);
+      setConversations(prev => [...prev, ...convs]);
+      setConversationsCursor(nextCursor);
+    } catch (error) {
+      console.error('Failed to load more conversations:', error);
+      setConversationsCursor(cursor);
     }
   };
 
@@ -60,6 +78,7 @@ function App() {
     setToken(null);
     setUser(null);
     setConversations([]);
+    setConversationsCursor(null);
     setActiveConversationId(null);
     localStorage.removeItem('token');
     localStorage.removeItem('user');
@@ -93,6 +112,7 @@ function App() {
         activeConversationId={activeConversationId}
         onSelectConversation={handleSelectConversation}
         onNewConversation={handleNewConversation}
+        onLoadMore={loadMoreConversations}
         userName={user?.name}
         onLogout={handleLogout}
       />
@@ -1,8 +1,19 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useLayoutEffect, useRef } from 'react';
 import ChatBubble from './ChatBubble';
 import ChatInput from './ChatInput';
 import './ChatWidget.css';
-import { sendMessage } from '../services/api';
+import { sendMessageStream, getConversationMessages } from '../services/api';
+
+// Start loading older messages when scrolled this close to the top (px)
+const LOAD_OLDER_THRESHOLD = 80;
+
+// Index of the last message saved on the server (streamed messages have no id yet)
+const lastSavedIndex = (msgs) => {
+  for (let i = msgs.length - 1; i >= 0; i--) {
+    if (msgs[i].id != null) return i;
+  }
+  return -1;
+};
 
 const ChatWidget = ({ token, conversationId: propConversationId, onConversationCreated }) => {
   const [messages, setMessages] = useState([]);
@@ -11,7 +22,18 @@ const ChatWidget = ({ token, conversationId: propConversationId, onConversationC
   const [humanHandoff, setHumanHandoff] = useState(false);
   const [welcomeMessage, setWelcomeMessage] = useState('');
   const [showPopup, setShowPopup] = useState(false);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const loadingOlderRef = useRef(false);
   const messagesEndRef = useRef(null);
+  const containerRef = useRef(null);
+  // Conversation whose messages are on screen, and the one being opened
+  const loadedIdRef = useRef(null);
+  const requestedIdRef = useRef(null);
+  // Messages already fetched per conversation, so reopening one only fetches what is new
+  const cacheRef = useRef({});
+  // Scroll position to keep while older messages are prepended
+  const scrollRestoreRef = useRef(null);
 
   useEffect(() => {
     // Update conversation ID when prop changes
@@ -21,7 +43,10 @@ const ChatWidget = ({ token, conversationId: propConversationId, onConversationC
       loadConversationMessages(propConversationId);
     } else {
       // New conversation - clear messages
+      loadedIdRef.current = null;
+      requestedIdRef.current = null;
       setMessages([]);
+      setOlderCursor(null);
       setHumanHandoff(false);
     }
   }, [propConversationId]);
@@ -42,26 +67,98 @@ const ChatWidget = ({ token, conversationId: propConversationId, onConversationC
     }
   }, [welcomeMessage, propConversationId]);
 
-  useEffect(() => {
+  useLayoutEffect(() => {
+    const container = containerRef.current;
+    const restore = scrollRestoreRef.current;
+    if (restore && container) {
+      // Older messages were prepended: keep the visible ones in place
+      scrollRestoreRef.current = null;
+      container.scrollTop = container.scrollHeight - restore.height + restore.top;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
+  useEffect(() => {
+    // Remember what has been fetched for the conversation on screen
+    if (loadedIdRef.current) {
+      cacheRef.current[loadedIdRef.current] = { messages, olderCursor };
+    }
+  }, [messages, olderCursor]);
+
+  useEffect(() => {
+    // Keep loading older pages until the history can be scrolled
+    const container = containerRef.current;
+    if (olderCursor && container && container.scrollHeight <= container.clientHeight) {
+      loadOlderMessages();
+    }
+  }, [olderCursor]);
+
   const loadConversationMessages = async (convId) => {
+    requestedIdRef.current = convId;
+    loadedIdRef.current = null;
     try {
-      const response = await fetch(`/api/user/conversations/${convId}/messages`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-      if (response.ok) {
-        const msgs = await response.json();
+      const cached = cacheRef.current[convId];
+      const lastIndex = cached ? lastSavedIndex(cached.messages) : -1;
+
+      if (lastIndex < 0) {
+        // First visit: only the latest page; older ones load on scroll-up
+        const data = await getConversationMessages(convId, token);
+        if (requestedIdRef.current !== convId) return;
+        loadedIdRef.current = convId;
+        setMessages(data.messages);
+        setOlderCursor(data.next_cursor);
+        return;
+      }
+
+      // Seen before: show the cached messages and fetch only newer ones
+      let msgs = cached.messages.slice(0, lastIndex + 1);
+      loadedIdRef.current = convId;
+      setMessages(msgs);
+      setOlderCursor(cached.olderCursor);
+
+      let hasMore = true;
+      while (hasMore) {
+        const data = await getConversationMessages(convId, token, { since: msgs[msgs.length - 1].id });
+        if (requestedIdRef.current !== convId || data.messages.length === 0) return;
+        msgs = [...msgs, ...data.messages];
         setMessages(msgs);
+        hasMore = data.has_more;
       }
     } catch (error) {
       console.error('Failed to load conversation messages:', error);
     }
   };
 
+  const loadOlderMessages = async () => {
+    const convId = loadedIdRef.current;
+    // The ref guards against scroll events that fire before the state updates
+    if (!convId || !olderCursor || loadingOlderRef.current) return;
+    loadingOlderRef.current = true;
+    setLoadingOlder(true);
+    try {
+      const data = await getConversationMessages(convId, token, { cursor: olderCursor });
+      if (loadedIdRef.current !== convId) return;
+      const container = containerRef.current;
+      scrollRestoreRef.current = container
+        ? { height: container.scrollHeight, top: container.scrollTop }
+        : null;
+      setMessages(prev => [...data.messages, ...prev]);
+      setOlderCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+    } finally {
+      loadingOlderRef.current = false;
+      setLoadingOlder(false);
+    }
+  };
+
+  const handleScroll = (e) => {
+    if (e.currentTarget.scrollTop < LOAD_OLDER_THRESHOLD) {
+      loadOlderMessages();
+    }
+  };
+
   const fetchWelcomeMessage = async () => {
     try {
       const response = await fetch('/api/admin/settings');
@@ -99,29 +196,51 @@ const ChatWidget = ({ token, conversationId: propConversationId, onConversationC
     setMessages(prev => [...prev, userMessage]);
     setIsLoading(true);
 
-    try {
-      const response = await sendMessage(messageText, conversationId, token);
-      
-      // Store conversation ID and notify parent
-      if (!conversationId) {
-        setConversationId(response.conversation_id);
-        localStorage.setItem('conversationId', response.conversation_id);
-        if (onConversationCreated) {
-          onConversationCreated();
-        }
+    let streamStarted = false;
+    const appendToken = (text) => {
+      if (!streamStarted) {
+        // First token: swap the typing indicator for the streaming reply
+        streamStarted = true;
+        setIsLoading(false);
+        setMessages(prev => [...prev, {
+          role: 'assistant',
+          content: text,
+          timestamp: new Date().toISOString()
+        }]);
+        return;
       }
+      setMessages(prev => {
+        const updated = [...prev];
+        const last = updated[updated.length - 1];
+        updated[updated.length - 1] = { ...last, content: last.content + text };
+        return updated;
+      });
+    };
 
-      // Add assistant response
-      const assistantMessage = {
-        role: 'assistant',
-        content: response.reply,
-        timestamp: new Date().toISOString(),
-        needsHuman: response.needs_human || false
-      };
-      setMessages(prev => [...prev, assistantMessage]);
+    try {
+      const response = await sendMessageStream(messageText, conversationId, token, {
+        onMeta: (meta) => {
+          // Store conversation ID and notify parent
+          if (!conversationId && meta.conversation_id) {
+            loadedIdRef.current = meta.conversation_id;
+            setConversationId(meta.conversation_id);
+            localStorage.setItem('conversationId', meta.conversation_id);
+          }
+        },
+        onToken: appendToken
+      });
+
+      if (!conversationId && onConversationCreated) {
+        onConversationCreated();
+      }
 
-      // Check for human handoff
+      // Mark the streamed reply with the human handoff flag
       if (response.needs_human) {
+        setMessages(prev => {
+          const updated = [...prev];
+          updated[updated.length - 1] = { ...updated[updated.length - 1], needsHuman: true };
+          return updated;
+        });
         setHumanHandoff(true);
       }
     } catch (error) {
@@ -148,9 +267,10 @@ const ChatWidget = ({ token, conversationId: propConversationId, onConversationC
         </div>
       </div>
       
-      <div className="chat-messages">
+      <div className="chat-messages" ref={containerRef} onScroll={handleScroll}>
+        {loadingOlder && <div className="loading-older">Loading earlier messages...</div>}
         {messages.map((msg, index) => (
-          <ChatBubble key={index} message={msg} onHumanConnect={handleHumanConnect} />
+          <ChatBubble key={msg.id ?? `local-${index}`} message={msg} onHumanConnect={handleHumanConnect} />
         ))}
         {isLoading && (
           <div className="typing-indicator">
@@ -1,7 +1,14 @@
 import React from 'react';
 import './ConversationSidebar.css';
 
-const ConversationSidebar = ({ conversations, activeConversationId, onSelectConversation, onNewConversation, userName, onLogout }) => {
+const ConversationSidebar = ({ conversations, activeConversationId, onSelectConversation, onNewConversation, onLoadMore, userName, onLogout }) => {
+  const handleScroll = (e) => {
+    const { scrollTop, scrollHeight, clientHeight } = e.currentTarget;
+    if (onLoadMore && scrollHeight - scrollTop - clientHeight < 100) {
+      onLoadMore();
+    }
+  };
+
   return (
     <div className="sidebar">
       <div className="sidebar-header">
@@ -21,7 +28,7 @@ const ConversationSidebar = ({ conversations, activeConversationId, onSelectConv
         New Conversation
       </button>
 
-      <div className="conversations-list">
+      <div className="conversations-list" onScroll={handleScroll}>
         {conversations.length === 0 ? (
           <div className="no-conversations">
             <p>No conversations yet</p>
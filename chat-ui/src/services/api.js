@@ -20,6 +20,61 @@ export const sendMessage = async (message, conversationId, token) => {
   return response.json();
 };
 
+// Stream a reply as Server-Sent Events; calls onMeta/onToken as events
+// arrive and resolves with the final "done" payload
+export const sendMessageStream = async (message, conversationId, token, { onMeta, onToken } = {}) => {
+  const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Authorization': `Bearer ${token}`
+    },
+    body: JSON.stringify({
+      message,
+      conversation_id: conversationId
+    })
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error('Failed to send message');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+
+    for (const rawEvent of events) {
+      let eventName = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      const payload = data ? JSON.parse(data) : {};
+
+      if (eventName === 'meta' && onMeta) onMeta(payload);
+      else if (eventName === 'token' && onToken) onToken(payload.text);
+      else if (eventName === 'done') result = payload;
+      else if (eventName === 'error') throw new Error(payload.detail || 'Failed to send message');
+    }
+  }
+
+  if (!result) {
+    throw new Error('Stream ended unexpectedly');
+  }
+
+  return result;
+};
+
 export const getConversation = async (conversationId) => {
   const response = await fetch(`${API_BASE_URL}/conversation/${conversationId}`);
 
@@ -74,8 +129,13 @@ export const userLogin = async (email, password) => {
   return response.json();
 };
 
-export const getUserConversations = async (token) => {
-  const response = await fetch(`${API_BASE_URL}/user/conversations`, {
+// One page of the user's conversations, most recent first; pass the
+// previous page's next_cursor to continue
+export const getUserConversations = async (token, cursor = null) => {
+  const params = new URLSearchParams();
+  if (cursor) params.set('cursor', cursor);
+
+  const response = await fetch(`${API_BASE_URL}/user/conversations?${params}`, {
     headers: {
       'Authorization': `Bearer ${token}`
     }
@@ -86,5 +146,26 @@ export const getUserConversations = async (token) => {
   }
 
   const data = await response.json();
-  return data.conversations || [];
+  return { conversations: data.conversations || [], nextCursor: data.next_cursor || null };
+};
+
+// Messages of a conversation, oldest first: the latest page by default, the
+// page before `cursor`, or only the messages after message id `since`
+export const getConversationMessages = async (conversationId, token, { cursor, since, limit } = {}) => {
+  const params = new URLSearchParams();
+  if (cursor) params.set('cursor', cursor);
+  if (since != null) params.set('since', since);
+  if (limit) params.set('limit', limit);
+
+  const response = await fetch(`${API_BASE_URL}/user/conversations/${conversationId}/messages?${params}`, {
+    headers: {
+      'Authorization': `Bearer ${token}`
+    }
+  });
+
+  if (!response.ok) {
+    throw new Error('Failed to get messages');
+  }
+
+  return response.json();
 };